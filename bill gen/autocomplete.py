@@ -0,0 +1,122 @@
+import tkinter as tk
+
+# Drop-down suggestion list under an Entry. Each keystroke calls
+# fetch(text) -> [(label, value), ...]; picking a suggestion (Return, Tab or a
+# click) calls on_select(value). Down moves into the list, Escape closes it.
+#
+# For slow sources (the billing service) pass delay, to wait for a pause in
+# typing, and background(func, on_done), to run fetch off the Tk thread. One
+# lookup runs at a time; text typed meanwhile is looked up when it returns.
+
+_navigation_keys = {"Up", "Down", "Return", "Escape", "Tab", "Shift_L", "Shift_R", "Control_L", "Control_R"}
+
+
+class AutocompletePopup:
+    def __init__(self, entry, fetch, on_select, rows=8, delay=0, background=None):
+        self.entry = entry
+        self.fetch = fetch
+        self.on_select = on_select
+        self.delay = delay
+        self.background = background
+        self.after_id = None
+        self.text = None  # text the suggestions are wanted for; None once closed
+        self.fetching = False
+        self.values = []
+        self.listbox = tk.Listbox(entry.winfo_toplevel(), height=rows, font=("Arial", 11),
+                                  exportselection=False, activestyle="dotbox")
+        self.visible = False
+
+        entry.bind("<KeyRelease>", self.on_key, add="+")
+        entry.bind("<Down>", self.focus_list, add="+")
+        entry.bind("<Escape>", lambda event: self.hide(), add="+")
+        entry.bind("<FocusOut>", lambda event: entry.after(150, self.hide_unless_focused), add="+")
+        self.listbox.bind("<Return>", self.choose)
+        self.listbox.bind("<Tab>", self.choose)
+        self.listbox.bind("<ButtonRelease-1>", self.choose)
+        self.listbox.bind("<Escape>", lambda event: self.hide(refocus=True))
+        self.listbox.bind("<Up>", self.on_list_up)
+
+    def on_key(self, event):
+        if event.keysym in _navigation_keys:
+            return
+        if not self.delay:
+            self.refresh()
+            return
+        if self.after_id is not None:
+            self.entry.after_cancel(self.after_id)
+        self.after_id = self.entry.after(self.delay, self.refresh)
+
+    def refresh(self):
+        self.after_id = None
+        self.text = self.entry.get()
+        if self.background is None:
+            self.show_suggestions(self.fetch(self.text))
+        elif not self.fetching:
+            self.fetch_in_background(self.text)
+
+    def fetch_in_background(self, text):
+        self.fetching = True
+
+        def on_done(suggestions, error):
+            self.fetching = False
+            if self.text is None:
+                return  # closed while the lookup ran
+            if self.text != text:
+                self.fetch_in_background(self.text)
+                return
+            self.show_suggestions(suggestions if error is None else [])
+
+        self.background(lambda: self.fetch(text), on_done)
+
+    def show_suggestions(self, suggestions):
+        if not suggestions:
+            self.hide()
+            return
+        self.values = [value for _, value in suggestions]
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(label for label, _ in suggestions))
+        self.show()
+
+    def show(self):
+        top = self.entry.winfo_toplevel()
+        x = self.entry.winfo_rootx() - top.winfo_rootx()
+        y = self.entry.winfo_rooty() - top.winfo_rooty() + self.entry.winfo_height()
+        self.listbox.place(x=x, y=y, width=max(self.entry.winfo_width(), 300))
+        self.listbox.lift()
+        self.visible = True
+
+    def hide(self, refocus=False):
+        self.text = None
+        if self.visible:
+            self.listbox.place_forget()
+            self.visible = False
+        if refocus:
+            self.entry.focus_set()
+
+    def hide_unless_focused(self):
+        if self.entry.focus_get() is not self.listbox:
+            self.hide()
+
+    def focus_list(self, event):
+        if not self.visible:
+            return None
+        self.listbox.focus_set()
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(0)
+        self.listbox.activate(0)
+        return "break"
+
+    def on_list_up(self, event):
+        # Up from the first suggestion goes back to the entry
+        if self.listbox.index(tk.ACTIVE) == 0:
+            self.hide(refocus=True)
+            return "break"
+        return None
+
+    def choose(self, event):
+        selection = self.listbox.curselection()
+        index = selection[0] if selection else self.listbox.index(tk.ACTIVE)
+        if 0 <= index < len(self.values):
+            self.on_select(self.values[index])
+        self.hide(refocus=True)
+        return "break"
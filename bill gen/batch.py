@@ -0,0 +1,175 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from billing_core import build_bill, make_item, render_html_bill
+from invoice_allocator import InvoiceAllocator
+from persistence import apply_bill, checkpoint_views, open_views
+from tax import to_basis_points
+from wal import WalInUse
+
+# Month-end batch invoicing:
+#
+#   python bill_prototype.py batch orders.csv [--workers N] [--queue-size N]
+#
+# orders.csv has one row per line item. Rows sharing an order_id make up one
+# invoice; customer fields and CGST/SGST/IGST are taken from the order's
+# first row. Set igst to yes for inter-state orders.
+#
+#   order_id,customer,gstin,address,item,hsn,qty,rate,gst,cgst,sgst[,igst]
+#
+# The parent process numbers the invoices and is the only writer of the bill
+# store and ledger; each finished group of bills is committed to the
+# write-ahead log with one fsync before it is applied. Workers compute totals
+# and render the HTML.
+
+batch_output_folder = "batch_invoices"
+
+
+def read_orders(csv_path):
+    orders = {}
+    with open(csv_path, "r", newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            order_id = (row.get("order_id") or "").strip()
+            if not order_id:
+                raise ValueError(f"{csv_path}:{line_no}: missing order_id")
+            order = orders.get(order_id)
+            if order is None:
+                orders[order_id] = order = {
+                    "order_id": order_id,
+                    "customer": row.get("customer", ""),
+                    "gstin": row.get("gstin", ""),
+                    "address": row.get("address", ""),
+                    "cgst": row.get("cgst", ""),
+                    "sgst": row.get("sgst", ""),
+                    "igst": (row.get("igst") or "").strip().lower() in ("1", "y", "yes", "true"),
+                    "lines": [],
+                }
+            order["lines"].append((line_no, row))
+    return list(orders.values())
+
+
+def order_items(order):
+    items = []
+    for line_no, row in order["lines"]:
+        try:
+            items.append(make_item(row.get("item", ""), row.get("hsn", ""), row.get("qty"), row.get("rate"), row.get("gst")))
+        except (TypeError, ValueError):
+            raise ValueError(f"line {line_no}: invalid qty, rate or gst") from None
+    return items
+
+
+def validate_order(order):
+    order_items(order)
+    for field in ("cgst", "sgst"):
+        try:
+            to_basis_points(order[field])
+        except ValueError:
+            raise ValueError(f"invalid {field}: {order[field]!r}") from None
+
+
+def process_order(order, invoice_number, date):
+    # Runs in a worker process
+    items = order_items(order)
+    bill = build_bill(invoice_number, order["customer"], order["gstin"], order["address"],
+                      items, order["cgst"], order["sgst"], date=date, igst=order["igst"])
+    return bill, render_html_bill(bill)
+
+
+def run_batch(csv_path, workers=None, queue_size=None, output_folder=batch_output_folder, date=None):
+    orders = read_orders(csv_path)
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or workers * 4
+    os.makedirs(output_folder, exist_ok=True)
+
+    wal, store, ledger, rollups, replayed = open_views()
+    # Lease numbers a queue's worth at a time; leftovers are logged as unused
+    allocator = InvoiceAllocator(terminal_id=f"batch-{os.getpid()}", block_size=queue_size, is_used=store.__contains__)
+    allocator.advance_past_bills(replayed)
+
+    saved, failed = 0, []
+    started = time.perf_counter()
+
+    def collect(done):
+        nonlocal saved
+        finished = []
+        for future in done:
+            order = pending.pop(future)
+            try:
+                finished.append(future.result())
+            except Exception as e:
+                failed.append((order["order_id"], str(e)))
+        lsns = [wal.append({"bill": bill}) for bill, _ in finished]
+        wal.sync()
+        for (bill, html), lsn in zip(finished, lsns):
+            apply_bill(store, ledger, rollups, bill, lsn)
+            with open(os.path.join(output_folder, f"{bill['invoice_number']}.html"), "w", encoding="utf-8") as f:
+                f.write(html)
+            saved += 1
+
+    pending = {}
+    finished_cleanly = False
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for order in orders:
+                # Reject bad orders before they are given an invoice number
+                try:
+                    validate_order(order)
+                except ValueError as e:
+                    failed.append((order["order_id"], str(e)))
+                    continue
+                # Bounded queue: never hold more than queue_size orders in flight
+                if len(pending) >= queue_size:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                invoice_number = allocator.next_invoice_number()
+                pending[pool.submit(process_order, order, invoice_number, date)] = order
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        finished_cleanly = True
+    finally:
+        allocator.release("batch finished")
+        rollups.save()
+        if finished_cleanly:
+            # Otherwise a logged bill may be missing from the views; the next
+            # startup replays the log instead
+            checkpoint_views(wal, store, ledger)
+        else:
+            store.sync()
+            ledger.sync()
+        store.close()
+        ledger.close()
+        wal.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "orders": len(orders),
+        "saved": saved,
+        "failed": failed,
+        "seconds": elapsed,
+        "bills_per_second": saved / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bill_prototype.py batch", description="Issue invoices in bulk from a CSV of orders.")
+    parser.add_argument("orders_csv")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--queue-size", type=int, default=None, help="max orders in flight (default: 4 x workers)")
+    parser.add_argument("--output-dir", default=batch_output_folder, help="folder for rendered HTML invoices")
+    parser.add_argument("--date", default=None, help="invoice date, 'YYYY-MM-DD HH:MM:SS' (default: now)")
+    args = parser.parse_args(argv)
+
+    try:
+        result = run_batch(args.orders_csv, args.workers, args.queue_size, args.output_dir, args.date)
+    except WalInUse as e:
+        print(e)
+        return 1
+    for order_id, error in result["failed"]:
+        print(f"Order {order_id} failed: {error}")
+    print(f"Saved {result['saved']} of {result['orders']} invoices in {result['seconds']:.2f}s "
+          f"({result['bills_per_second']:.1f} bills/second)")
+    return 1 if result["failed"] else 0
@@ -0,0 +1,257 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+# Headless benchmarks for the billing hot paths at growing data sizes.
+#
+#   python benchmark.py --scale 1k --scale 100k --output results.json
+#   python benchmark.py --scale 1k --compare baseline.json
+#
+# Each scale runs in its own process inside a scratch folder: a seeded
+# synthetic history of bills is loaded into the bill store, ledger and
+# rollups, then each hot path is timed for a fixed number of samples on top
+# of that history. Results (p50/p99 latency, throughput, peak RSS) go to a
+# JSON file that later runs can be compared against.
+
+scales = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+default_samples = 200
+
+_first_names = ["Ram", "Shyam", "Gupta", "Patel", "Singh", "Sharma", "Verma", "Yadav", "Reddy", "Iyer", "Khan", "Das"]
+_trades = ["Traders", "Cranes", "Hydraulics", "Engineering", "Fittings", "Steel", "Logistics", "Infra", "Motors", "Works"]
+_parts = ["Hose Pipe", "Crane Hook", "Wire Rope", "Hydraulic Seal", "Pulley", "Coupling", "Valve", "Gasket", "Bearing", "Nipple"]
+_gst_rates = [5, 12, 18, 28]
+
+
+class SyntheticData:
+    # Deterministic customers, items and bills for a given seed
+    def __init__(self, seed=42, customers=2000, items=500):
+        self.random = random.Random(seed)
+        r = self.random
+        self.customers = [
+            {
+                "customer": f"{r.choice(_first_names)} {r.choice(_trades)} {i}",
+                "gst": f"{r.randint(1, 37):02d}AAACS{i:04d}{r.choice('ABCDEFGH')}1Z{r.randint(0, 9)}",
+                "address": f"Plot {r.randint(1, 999)}, Industrial Area, City {r.randint(1, 50)}",
+            }
+            for i in range(customers)
+        ]
+        self.items = [
+            {
+                "name": f"{r.choice(_parts)} {r.choice(['S', 'M', 'L', 'XL'])}-{i}",
+                "hsn": str(r.choice([8425, 8426, 8431, 4009, 7312, 8481, 8482, 4016])),
+                "rate": round(r.uniform(10, 5000), 2),
+                "gst": r.choice(_gst_rates),
+            }
+            for i in range(items)
+        ]
+
+    def bills(self, count, start=1, days=730, max_lines=8):
+        from billing_core import build_bill, format_invoice_number, make_item
+
+        r = self.random
+        first_day = datetime(2024, 1, 1)
+        step = timedelta(days=days) / max(count, 1)
+        for i in range(count):
+            customer = r.choice(self.customers)
+            items = [
+                make_item(item["name"], item["hsn"], r.randint(1, 20), item["rate"], item["gst"])
+                for item in r.sample(self.items, r.randint(1, max_lines))
+            ]
+            yield build_bill(
+                format_invoice_number(start + i),
+                customer["customer"], customer["gst"], customer["address"],
+                items, "", "",
+                date=(first_day + step * i).strftime('%Y-%m-%d %H:%M:%S'),
+            )
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    total = sum(latencies)
+    return {
+        "samples": n,
+        "p50_ms": round(latencies[n // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 3),
+        "ops_per_sec": round(n / total, 1) if total else None,
+    }
+
+
+def time_op(func, inputs):
+    latencies = []
+    for value in inputs:
+        started = time.perf_counter()
+        func(value)
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def run_scale(scale, samples=default_samples, seed=42):
+    # Runs in a fresh process so peak RSS belongs to this scale alone
+    from bill_store import open_bill_store
+    from billing_core import render_html_bill
+    from ledger import TransactionLedger
+    from persistence import apply_bill, checkpoint_groups, checkpoint_views
+    from render_cache import RenderCache
+    from rollups import MonthlyRollups, export_month
+    from search_index import BillSearchIndex
+    from wal import WriteAheadLog
+
+    count = scales[scale]
+    data = SyntheticData(seed)
+    results = {}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"bill-bench-{scale}-") as workdir:
+        os.chdir(workdir)
+        store = open_bill_store()
+        ledger = TransactionLedger()
+        rollups = MonthlyRollups()
+
+        # Load the history, timing it as bulk throughput
+        started = time.perf_counter()
+        for bill in data.bills(count):
+            store.append(bill)
+            ledger.append_bill(bill)
+            rollups.add_bill(bill)
+        store.sync()
+        ledger.sync()
+        rollups.save()
+        elapsed = time.perf_counter() - started
+        results["load_history"] = {"bills": count, "seconds": round(elapsed, 2), "bills_per_sec": round(count / elapsed, 1)}
+
+        new_bills = list(data.bills(samples, start=count + 1))
+
+        wal = WriteAheadLog()
+        checkpoint_views(wal, store, ledger)
+        saves = 0
+
+        def save_bill(bill):
+            # What the persistence worker does for a group of one bill: commit
+            # it to the write-ahead log, apply it to the views, and checkpoint
+            # every checkpoint_groups groups
+            nonlocal saves
+            lsn = wal.append({"bill": bill})
+            wal.sync()
+            apply_bill(store, ledger, rollups, bill, lsn)
+            rollups.save()
+            saves += 1
+            if saves % checkpoint_groups == 0:
+                checkpoint_views(wal, store, ledger)
+
+        results["save_bill"] = time_op(save_bill, new_bills)
+        results["append_to_transactions"] = time_op(ledger.append_bill, new_bills)
+        results["generate_html_bill"] = time_op(render_html_bill, new_bills)
+        render_cache = RenderCache()
+        time_op(render_cache.path_for, new_bills)
+        results["reopen_rendered_bill"] = time_op(render_cache.path_for, new_bills)
+
+        started = time.perf_counter()
+        index = BillSearchIndex().build(store)
+        results["search_index_build"] = {"seconds": round(time.perf_counter() - started, 2)}
+
+        r = random.Random(seed)
+        customers = [c["customer"] for c in r.sample(data.customers, min(samples, len(data.customers)))]
+        invoices = r.sample(store.invoice_numbers(), min(samples, len(store)))
+        results["search_invoice"] = time_op(lambda inv: index.search(inv, field="Invoice Number"), invoices)
+        results["search_customer_prefix"] = time_op(lambda name: index.search(name[:4], limit=100), customers)
+        results["search_date_range"] = time_op(
+            lambda month: index.search(date_from=f"{month}-01", date_to=f"{month}-31"),
+            [f"{2024 + i % 2}-{1 + i % 12:02d}" for i in range(samples)],
+        )
+        results["view_bill"] = time_op(store.get, invoices)
+
+        if importlib.util.find_spec("pandas") is None:
+            results["export_to_excel"] = {"skipped": "pandas not installed"}
+        else:
+            month = new_bills[-1]["date"][:7]
+            results["export_to_excel"] = time_op(lambda _: export_month(rollups, month, ledger), range(min(samples, 20)))
+
+        store.close()
+        ledger.close()
+        wal.close()
+        os.chdir(cwd)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare(current, baseline, threshold=0.10, noise_ms=0.05):
+    # Lines like "100k save_bill p50 1.20ms -> 0.30ms (-75%)". A p50 more than
+    # `threshold` slower is a regression, unless it moved by less than
+    # `noise_ms` (microsecond-level operations jitter by more than 10%).
+    lines, regressions = [], 0
+    for scale, ops in current["scales"].items():
+        base_ops = baseline.get("scales", {}).get(scale, {})
+        for op, stats in ops.items():
+            base = base_ops.get(op)
+            if not isinstance(stats, dict) or not isinstance(base, dict) or "p50_ms" not in stats or "p50_ms" not in base:
+                continue
+            if not base["p50_ms"]:
+                continue
+            change = stats["p50_ms"] / base["p50_ms"] - 1
+            flag = ""
+            if change > threshold and stats["p50_ms"] - base["p50_ms"] >= noise_ms:
+                flag = "  REGRESSION"
+                regressions += 1
+            lines.append(f"{scale:>5} {op:<24} p50 {base['p50_ms']:.3f}ms -> {stats['p50_ms']:.3f}ms ({change:+.0%}){flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the billing hot paths on synthetic data.")
+    parser.add_argument("--scale", action="append", choices=sorted(scales), help="data size to run (repeatable, default: 1k)")
+    parser.add_argument("--samples", type=int, default=default_samples, help="timed operations per hot path")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "samples": args.samples,
+        "scales": {},
+    }
+    for scale in args.scale or ["1k"]:
+        print(f"Running {scale} ...", flush=True)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            report["scales"][scale] = pool.submit(run_scale, scale, args.samples, args.seed).result()
+        for op, stats in report["scales"][scale].items():
+            print(f"  {op:<24} {stats}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            lines, regressions = compare(report, json.load(f), args.threshold)
+        print("\n".join(lines))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,46 @@
+from startup import startup_timer, preload_in_background, import_profile, write_startup_report
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, simpledialog
-import json
-import pandas as pd
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
 import os
-import tempfile
+import sys
+import threading
 import webbrowser
-from tkinterhtml import HtmlFrame
-
-bills_file = "bills.json"
-invoice_counter_file = "invoice_counter.json"
-transactions_file = "transactions.xlsx"  # File to store all transactions
+import metrics
+from bill_store import bills_log_file, bills_index_file, bills_partition_folder, legacy_bills_file
+from ledger import ledger_folder, transactions_file
+from search_index import BillSearchIndex, SearchCancelled
+from results_view import PagedResultsView
+from autocomplete import AutocompletePopup
+from customers import CustomerMaster
+from items import ItemCatalog
+from render_cache import PrintSpool, print_spool_folder, render_cache_folder
+from billing_core import build_bill, parse_invoice_number
+from line_items import LineItems, parse_pasted_lines
+from tax import from_paise
+from invoice_allocator import InvoiceAllocator, audit_gaps
+from persistence import PersistenceWorker, open_views
+from wal import WalInUse, wal_file
+from service_client import (BillingClient, RemoteAllocator, RemoteBillStore, RemoteCustomers,
+                            RemoteItems, RemotePersistence, RemoteSearchIndex)
+from rollups import MonthlyRollups, export_month, rebuild_all
+from gst_report import export_hsn_summary, parse_month
+
+# pandas/openpyxl are imported by the export functions that need them; set
+# BILL_PRELOAD=0 to skip warming them up in the background after startup
+preload_enabled = os.environ.get("BILL_PRELOAD", "1") != "0"
+
+# Set to e.g. http://127.0.0.1:8765 to work against a billing service
+# (python bill_prototype.py serve) instead of the files in this folder
+service_url = os.environ.get("BILL_SERVICE_URL")
+
+# Data files whose sizes are logged as gauges (see metrics.py)
+gauged_files = [bills_log_file, bills_index_file, bills_partition_folder, legacy_bills_file, ledger_folder, transactions_file, wal_file,
+                render_cache_folder, print_spool_folder]
+
+# Spans that can be captured with cProfile from the Performance panel
+profiled_spans = ["save_bill", "ledger.append", "bill_store.append", "persist.sync", "wal.commit", "export_month",
+                  "export_xlsx", "gst_report", "render_html", "print_spool", "search", "search_index.build"]
 
 class BillingApp:
     def __init__(self, root):
@@ -18,75 +48,127 @@ class BillingApp:
         self.root.title("Billing System - company name")
         self.root.attributes('-fullscreen', True)
 
-        self.items = []
+        self.items = LineItems()
         self.customer_name = tk.StringVar()
         self.customer_gst = tk.StringVar()
         self.customer_address = tk.StringVar()
         self.cgst = tk.StringVar()
         self.sgst = tk.StringVar()
+        self.igst = tk.BooleanVar()
         self.invoice_number = tk.StringVar()
         self.search_term = tk.StringVar()
-        
-        # Initialize invoice counter
-        self.invoice_counter = self.load_invoice_counter()
-        self.update_invoice_number()
-        
-        # Initialize transactions Excel file if it doesn't exist
-        if not os.path.exists(transactions_file):
-            self.initialize_transactions_file()
+
+        self.search_index = None
+        self.print_spool = None
+        self.search_index_lock = threading.Lock()
+        # Bills saved while the index is being built, added once it is done
+        self.search_index_pending = None
+        self.search_index_pending_lock = threading.Lock()
+        self.search_cancel = None
+        self.search_after_id = None
+        self.retax_after_id = None
+        for var in (self.cgst, self.sgst, self.igst):
+            var.trace_add("write", lambda *args: self.schedule_retax())
+
+        # Data files are opened once the form is on screen (see load_data_files)
+        self.client = BillingClient(service_url) if service_url else None
+        self.ready = False
+        self.bill_store = None
+        self.allocator = None
+        self.ledger = None
+        self.rollups = None
+        self.wal = None
+        self.customers = None
+        self.item_catalog = None
+        self.persistence = None
+        self.invoice_saved = False
+        # Date of the bill on screen, fixed by its first preview, print or save
+        self.bill_date = None
         
         self.create_widgets()
         self.create_menu()
-
-    def initialize_transactions_file(self):
-        # Create a DataFrame with the correct columns and save to Excel
-        columns = [
-            "Invoice No", "Date", "Customer", "GSTIN", "Address",
-            "Item", "HSN", "Qty", "Rate", "Item GST", "Item Total",
-            "CGST", "SGST", "Bill Total"
-        ]
-        df = pd.DataFrame(columns=columns)
-        df.to_excel(transactions_file, index=False)
-
-    def append_to_transactions(self, bill_data):
-        try:
-            # Read existing transactions
-            existing_df = pd.read_excel(transactions_file)
-        except:
-            existing_df = pd.DataFrame()
-
-        # Prepare new rows for each item in the bill
-        new_rows = []
-        for item in bill_data['items']:
-            new_row = {
-                "Invoice No": bill_data['invoice_number'],
-                "Date": bill_data['date'],
-                "Customer": bill_data['customer'],
-                "GSTIN": bill_data['gst'],
-                "Address": bill_data['address'],
-                "Item": item['name'],
-                "HSN": item['hsn'],
-                "Qty": item['qty'],
-                "Rate": item['rate'],
-                "Item GST": item['gst'],
-                "Item Total": item['total'],
-                "CGST": bill_data['cgst'],
-                "SGST": bill_data['sgst'],
-                "Bill Total": bill_data['total']
-            }
-            new_rows.append(new_row)
-
-        # Create DataFrame from new rows
-        new_df = pd.DataFrame(new_rows)
-        
-        # Combine with existing data
-        if not existing_df.empty:
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
+        self.status_label.config(text="Loading bills...")
+        startup_timer.mark("widgets created")
+        self.root.after_idle(lambda: self.root.after(1, self.start_loading))
+
+    def start_loading(self):
+        # First idle point after the window was drawn
+        startup_timer.mark("window drawn")
+        self.run_in_background(self.load_data_files, self.on_data_files_loaded)
+
+    def load_data_files(self):
+        # Runs on a worker thread: file work only, no Tk calls
+        if self.client is not None:
+            return self.connect_service()
+
+        # Bill store, ledger and monthly rollups, caught up from the tail of
+        # the write-ahead log after a crash; the old bills.json and
+        # transactions.xlsx are imported on first run
+        wal, bill_store, ledger, rollups, replayed = open_views()
+
+        # Invoice numbers are leased in blocks from the shared allocator
+        allocator = InvoiceAllocator(
+            block_size=int(os.environ.get("BILL_LEASE_SIZE", 10)),
+            is_used=bill_store.__contains__,
+        )
+        allocator.advance_past_bills(replayed)
+        invoice_number = allocator.next_invoice_number()
+
+        # Customer master for the name/GSTIN autocomplete
+        customers = CustomerMaster().load(bill_store)
+
+        # Item catalog for the Add Item form, built from the ledger
+        item_catalog = ItemCatalog().load(ledger)
+        return bill_store, allocator, invoice_number, ledger, rollups, customers, item_catalog, wal
+
+    def connect_service(self):
+        # Same pieces as load_data_files, backed by the billing service
+        self.client.health()
+        allocator = RemoteAllocator(self.client, block_size=int(os.environ.get("BILL_LEASE_SIZE", 10)))
+        invoice_number = allocator.next_invoice_number()
+        return (RemoteBillStore(self.client), allocator, invoice_number, None, None,
+                RemoteCustomers(self.client), RemoteItems(self.client), None)
+
+    def on_data_files_loaded(self, result, error):
+        if error is not None:
+            self.status_label.config(text="Failed to open data files")
+            messagebox.showerror("Error", f"Failed to open data files:\n{error}")
+            return
+        (self.bill_store, self.allocator, invoice_number, self.ledger,
+         self.rollups, self.customers, self.item_catalog, self.wal) = result
+        self.invoice_number.set(invoice_number)
+
+        # Saves are written by a background worker so the window never blocks
+        if self.client is not None:
+            self.persistence = RemotePersistence(self.client)
+            self.root.title(f"{self.root.title()} ({self.client.base_url})")
         else:
-            combined_df = new_df
-        
-        # Save back to Excel
-        combined_df.to_excel(transactions_file, index=False)
+            self.persistence = PersistenceWorker(self.bill_store, self.ledger, self.rollups, wal=self.wal)
+        self.ready = True
+        self.status_label.config(text="")
+        self.root.after(100, self.poll_persistence)
+        startup_timer.mark("data files loaded")
+        for name, ms in startup_timer.marks.items():
+            metrics.record(f"startup.{name}", ms)
+        if self.client is None:
+            metrics.record_file_gauges(gauged_files, force=True)
+        if preload_enabled:
+            preload_in_background()
+
+    def check_ready(self):
+        if not self.ready:
+            messagebox.showinfo("Please Wait", "Bills are still loading, try again in a moment.")
+        return self.ready
+
+    def check_local(self):
+        # Reports and imports work on the data files, so only where they live
+        if not self.check_ready():
+            return False
+        if self.client is not None:
+            messagebox.showinfo("Not Available", "Run this on the machine hosting the billing service.")
+            return False
+        return True
 
     def create_menu(self):
         menubar = tk.Menu(self.root)
@@ -97,77 +179,222 @@ class BillingApp:
         file_menu.add_command(label="Print Bill", command=self.print_bill)
         file_menu.add_separator()
         file_menu.add_command(label="Export to Excel", command=self.export_to_excel)
+        file_menu.add_command(label="Import Price List...", command=self.import_price_list)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.destroy)
+        file_menu.add_command(label="Exit", command=self.exit_app)
         menubar.add_cascade(label="File", menu=file_menu)
         
         # Reports menu
         reports_menu = tk.Menu(menubar, tearoff=0)
         reports_menu.add_command(label="Search Bills", command=self.show_search_window)
         reports_menu.add_command(label="View Transactions", command=self.view_transactions)
+        reports_menu.add_command(label="Rebuild Monthly Reports", command=self.rebuild_monthly_reports)
+        reports_menu.add_command(label="HSN-wise GST Summary...", command=self.export_gst_summary)
+        reports_menu.add_command(label="Unused Invoice Numbers", command=self.show_invoice_audit)
+        reports_menu.add_separator()
+        reports_menu.add_command(label="Performance", command=self.show_performance_panel)
         menubar.add_cascade(label="Reports", menu=reports_menu)
         
         self.root.config(menu=menubar)
 
     def export_to_excel(self):
-        if not self.items:
-            messagebox.showwarning("No Items", "Add items to export.")
+        if not self.check_local():
             return
+        # This month's workbook, written from the incremental rollups
+        self.persistence.flush()
+        month = datetime.now().strftime("%Y-%m")
+        try:
+            with metrics.span("export_month"):
+                file_path = export_month(self.rollups, month, self.ledger)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export monthly report:\n{str(e)}")
+            return
+        messagebox.showinfo("Exported", f"Data exported to {file_path}")
 
-        bill_data = self.generate_bill_data()
+    def rebuild_monthly_reports(self):
+        if not self.check_local():
+            return
+        # Recompute every month's rollup from the ledger off the Tk thread
+        self.persistence.flush()
+        self.status_label.config(text="Rebuilding monthly reports...")
+
+        def rebuild():
+            # Under the persistence worker, so no bill lands in the old
+            # rollups after the rebuild has read its month
+            with self.persistence.paused():
+                rollups = MonthlyRollups()
+                months = rebuild_all(rollups, self.ledger, lsn=self.persistence.applied_lsn)
+                self.rollups = self.persistence.rollups = rollups
+            return months
+
+        self.run_in_background(rebuild, self.on_reports_rebuilt)
+
+    def export_gst_summary(self):
+        if not self.check_local():
+            return
+        from tkinter import simpledialog
+        # Defaults to the financial year so far (April to this month)
         now = datetime.now()
-        month_str = now.strftime("%B_%Y")  # e.g., "April_2025"
-        filename = f"{month_str}.xlsx"
-
-        # Create folder to save monthly reports (optional)
-        output_folder = "monthly_reports"
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        file_path = os.path.join(output_folder, filename)
-
-        df = pd.DataFrame([{
-            "Invoice No": bill_data.get("invoice_number", ""),
-            "Date": bill_data.get("date", ""),
-            "Customer Name": bill_data.get("customer", ""),
-            "Phone": bill_data.get("phone", ""),
-            "Address": bill_data.get("address", ""),
-            "Item Details": ", ".join([f'{i.get("name", "")}({i.get("qty", 0)}x{i.get("rate", 0)})' for i in bill_data.get("items", [])]),
-            "Subtotal": bill_data.get("subtotal", 0),
-            "CGST": bill_data.get("cgst", 0),
-            "SGST": bill_data.get("sgst", 0),
-            "Total": bill_data.get("total", 0)
-        }])
-
-        if os.path.exists(file_path):
-            existing_df = pd.read_excel(file_path)
-            df = pd.concat([existing_df, df], ignore_index=True)
-
-        df.to_excel(file_path, index=False)
-        messagebox.showinfo("Exported", f"Data exported to {file_path}")
+        year_start = f"{now.year if now.month >= 4 else now.year - 1}-04"
+        months = []
+        for prompt, default in (("From month (YYYY-MM):", year_start), ("To month (YYYY-MM):", now.strftime("%Y-%m"))):
+            value = simpledialog.askstring("HSN-wise GST Summary", prompt, initialvalue=default, parent=self.root)
+            if value is None:
+                return
+            try:
+                months.append(parse_month(value))
+            except ValueError:
+                messagebox.showerror("Error", f"Not a month: {value!r} (use YYYY-MM)")
+                return
+        self.persistence.flush()
+        self.status_label.config(text="Building HSN summary...")
+
+        def build():
+            with metrics.span("gst_report"):
+                return export_hsn_summary(self.ledger, *months)
+
+        self.run_in_background(build, self.on_gst_summary_exported)
+
+    def on_gst_summary_exported(self, path, error):
+        self.status_label.config(text="")
+        if error is not None:
+            messagebox.showerror("Error", f"Failed to build HSN summary:\n{error}")
+            return
+        messagebox.showinfo("Exported", f"HSN summary exported to {path}")
+
+    def on_reports_rebuilt(self, months, error):
+        if error is not None:
+            self.status_label.config(text="")
+            messagebox.showerror("Error", f"Failed to rebuild monthly reports:\n{error}")
+            return
+        self.status_label.config(text=f"Rebuilt reports for {len(months)} month(s)")
+
+    def run_in_background(self, func, on_done):
+        # Run func on a thread and call on_done(result, error) back on the
+        # Tk thread once it finishes
+        outcome = {}
+
+        def worker():
+            try:
+                outcome["result"] = func()
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        def check():
+            if thread.is_alive():
+                self.root.after(100, check)
+            else:
+                on_done(outcome.get("result"), outcome.get("error"))
+
+        self.root.after(100, check)
 
     def view_transactions(self):
+        if not self.check_local():
+            return
         try:
-            # Open the transactions file in default application
-            webbrowser.open(os.path.abspath(transactions_file))
+            # Rebuild the Excel export if needed and open it
+            self.persistence.flush()
+            with metrics.span("export_xlsx"):
+                path = self.ledger.export_xlsx()
+            webbrowser.open(os.path.abspath(path))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open transactions file:\n{str(e)}")
 
-    def load_invoice_counter(self):
-        try:
-            if os.path.exists(invoice_counter_file):
-                with open(invoice_counter_file, 'r') as f:
-                    return json.load(f).get('counter', 1)
-            return 1
-        except:
-            return 1
-
-    def save_invoice_counter(self):
-        with open(invoice_counter_file, 'w') as f:
-            json.dump({'counter': self.invoice_counter}, f)
+    def show_invoice_audit(self):
+        if not self.check_local():
+            return
+        # Leased invoice numbers that are not on any saved bill (GST audit)
+        gaps = audit_gaps(self.bill_store)
+        audit_window = tk.Toplevel(self.root)
+        audit_window.title("Unused Invoice Numbers")
+        audit_window.geometry("600x400")
+
+        tk.Label(audit_window, text=f"{len(gaps)} leased invoice numbers were never used", font=("Arial", 12)).pack(pady=10)
+        columns = ("Invoice No", "Terminal", "Status")
+        audit_tree = ttk.Treeview(audit_window, columns=columns, show="headings")
+        for col in columns:
+            audit_tree.heading(col, text=col)
+        audit_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for gap in gaps:
+            status = "Released" if gap["released"] else "Unsaved / in use"
+            audit_tree.insert("", "end", values=(gap["invoice_number"], gap["terminal"], status))
+
+    def show_performance_panel(self):
+        # Recent latencies per span and the latest file sizes, refreshed every
+        # second while the window is open
+        panel = tk.Toplevel(self.root)
+        panel.title("Performance")
+        panel.geometry("700x500")
+
+        if not metrics.enabled:
+            tk.Label(panel, text="Metrics are switched off (BILL_METRICS=0).", font=("Arial", 12)).pack(pady=20)
+            return
 
-    def update_invoice_number(self):
-        self.invoice_number.set(f"SS-{self.invoice_counter:04d}")
+        columns = ("Operation", "Count", "Last ms", "p50 ms", "p99 ms", "Max ms")
+        spans_tree = ttk.Treeview(panel, columns=columns, show="headings", height=12)
+        for col in columns:
+            spans_tree.heading(col, text=col)
+            spans_tree.column(col, width=180 if col == "Operation" else 80, anchor="w" if col == "Operation" else "e")
+        spans_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        gauges_label = tk.Label(panel, text="", font=("Arial", 10), justify="left", anchor="w")
+        gauges_label.pack(fill=tk.X, padx=10)
+
+        profile_frame = tk.Frame(panel)
+        profile_frame.pack(fill=tk.X, padx=10, pady=10)
+        tk.Label(profile_frame, text="Profile next:").pack(side=tk.LEFT)
+        profile_choice = ttk.Combobox(profile_frame, values=profiled_spans, state="readonly", width=20)
+        profile_choice.current(0)
+        profile_choice.pack(side=tk.LEFT, padx=5)
+        tk.Button(profile_frame, text="Capture", command=lambda: metrics.profile_next(profile_choice.get())).pack(side=tk.LEFT)
+        profile_label = tk.Label(profile_frame, text="", font=("Arial", 10), anchor="w")
+        profile_label.pack(side=tk.LEFT, padx=10)
+
+        def refresh():
+            if not panel.winfo_exists():
+                return
+            spans, gauges = metrics.snapshot()
+            spans_tree.delete(*spans_tree.get_children())
+            for name, stats in sorted(spans.items()):
+                spans_tree.insert("", "end", values=(name, stats["count"], f"{stats['last']:.1f}", f"{stats['p50']:.1f}",
+                                                     f"{stats['p99']:.1f}", f"{stats['max']:.1f}"))
+            gauges_label.config(text="\n".join(f"{name[5:]}: {value / 1024:,.0f} KB"
+                                               for name, value in sorted(gauges.items()) if name.startswith("size:")))
+            if metrics.profile_pending():
+                profile_label.config(text=f"Waiting for {metrics.profile_pending()}...")
+            elif metrics.last_profile:
+                profile_label.config(text=f"Saved {metrics.last_profile}")
+            panel.after(1000, refresh)
+
+        refresh()
+
+    def exit_app(self):
+        # Finish queued writes, record the numbers this terminal leased but
+        # never used, then quit
+        if not self.ready:
+            # Nothing saved or leased through this window yet
+            self.root.destroy()
+            return
+        self.pending_label.config(text="Finishing pending writes...")
+        self.root.update_idletasks()
+        self.persistence.close()
+        for bill_data, error in self.persistence.completed():
+            if error is None:
+                self.customers.add_bill(bill_data)
+                self.item_catalog.add_bill(bill_data)
+        if self.client is None:
+            self.customers.save(len(self.bill_store))
+            self.item_catalog.save(self.ledger)
+            self.wal.close()
+        if not self.invoice_saved:
+            self.allocator.return_number(parse_invoice_number(self.invoice_number.get()))
+        self.allocator.release("exit")
+        if self.print_spool is not None:
+            self.print_spool.cleanup()
+        self.root.destroy()
 
     def create_widgets(self):
         header_frame = tk.Frame(self.root, bg="#1e3d59", pady=10)
@@ -180,6 +407,9 @@ class BillingApp:
 
         customer_frame = tk.Frame(self.root, pady=5)
         customer_frame.pack()
+        # Lookups against the billing service wait for a pause in typing and
+        # run off the Tk thread
+        lookups = dict(delay=200, background=self.run_in_background) if self.client is not None else {}
 
         # Add Invoice Number field
         tk.Label(customer_frame, text="Invoice No:", font=("Arial", 12)).grid(row=0, column=0, sticky='w')
@@ -188,10 +418,12 @@ class BillingApp:
         tk.Label(customer_frame, text="Customer Name:", font=("Arial", 12)).grid(row=1, column=0, sticky='w')
         self.customer_entry = tk.Entry(customer_frame, textvariable=self.customer_name, width=50, font=("Arial", 12))
         self.customer_entry.grid(row=1, column=1, columnspan=3, sticky='w')
+        self.customer_popup = AutocompletePopup(self.customer_entry, self.customer_suggestions, self.fill_customer, **lookups)
 
         tk.Label(customer_frame, text="Customer GST:", font=("Arial", 12)).grid(row=2, column=0, sticky='w')
         self.customer_gst_entry = tk.Entry(customer_frame, textvariable=self.customer_gst, width=30, font=("Arial", 12))
         self.customer_gst_entry.grid(row=2, column=1, sticky='w')
+        self.gstin_popup = AutocompletePopup(self.customer_gst_entry, self.gstin_suggestions, self.fill_customer, **lookups)
 
         tk.Label(customer_frame, text="Address:", font=("Arial", 12)).grid(row=3, column=0, sticky='nw')
         self.customer_address_entry = tk.Text(customer_frame, width=50, height=3, font=("Arial", 12))
@@ -203,10 +435,12 @@ class BillingApp:
         tk.Label(form_frame, text="Item Name:", font=("Arial", 12)).grid(row=0, column=0)
         self.item_name = tk.Entry(form_frame, font=("Arial", 12))
         self.item_name.grid(row=0, column=1)
+        self.item_popup = AutocompletePopup(self.item_name, self.item_suggestions, self.fill_item, **lookups)
 
         tk.Label(form_frame, text="HSN:", font=("Arial", 12)).grid(row=0, column=2)
         self.item_hsn = tk.Entry(form_frame, font=("Arial", 12))
         self.item_hsn.grid(row=0, column=3)
+        self.hsn_popup = AutocompletePopup(self.item_hsn, self.hsn_suggestions, self.fill_item, **lookups)
 
         tk.Label(form_frame, text="Quantity:", font=("Arial", 12)).grid(row=1, column=0)
         self.item_qty = tk.Entry(form_frame, font=("Arial", 12))
@@ -221,6 +455,8 @@ class BillingApp:
         self.item_gst.grid(row=2, column=1)
 
         tk.Button(form_frame, text="Add Item", font=("Arial", 12), bg="lightgreen", command=self.add_item).grid(row=2, column=3)
+        tk.Button(form_frame, text="Paste Items", font=("Arial", 12), command=self.paste_items).grid(row=3, column=1, pady=5)
+        tk.Button(form_frame, text="Import Items...", font=("Arial", 12), command=self.import_items).grid(row=3, column=3, pady=5)
 
         tax_frame = tk.Frame(self.root)
         tax_frame.pack()
@@ -228,122 +464,289 @@ class BillingApp:
         tk.Entry(tax_frame, textvariable=self.cgst, font=("Arial", 12), width=10).grid(row=0, column=1)
         tk.Label(tax_frame, text="SGST %:", font=("Arial", 12)).grid(row=0, column=2)
         tk.Entry(tax_frame, textvariable=self.sgst, font=("Arial", 12), width=10).grid(row=0, column=3)
+        tk.Checkbutton(tax_frame, text="Inter-state (IGST)", variable=self.igst, font=("Arial", 12)).grid(row=0, column=4, padx=10)
 
         self.tree = ttk.Treeview(self.root, columns=("name", "hsn", "qty", "rate", "gst", "total"), show="headings")
         for col in self.tree["columns"]:
             self.tree.heading(col, text=col.capitalize())
-        self.tree.pack(pady=10, fill=tk.X)
+        self.tree.pack(pady=(10, 0), fill=tk.X)
+        self.tree.bind("<Delete>", lambda event: self.remove_selected_items())
+        self.totals_label = tk.Label(self.root, text="", font=("Arial", 12, "bold"), anchor="e")
+        self.totals_label.pack(fill=tk.X, padx=10)
+        self.update_totals_label()
 
         button_frame = tk.Frame(self.root, pady=10)
         button_frame.pack()
         tk.Button(button_frame, text="Preview Bill", font=("Arial", 12), bg="skyblue", command=self.preview_bill).grid(row=0, column=0, padx=10)
         tk.Button(button_frame, text="Save Bill", font=("Arial", 12), bg="lightgreen", command=self.save_bill).grid(row=0, column=1, padx=10)
         tk.Button(button_frame, text="Reset", font=("Arial", 12), bg="orange", command=self.reset_form).grid(row=0, column=2, padx=10)
-        tk.Button(button_frame, text="Exit", font=("Arial", 12), bg="tomato", command=self.root.destroy).grid(row=0, column=3, padx=10)
+        tk.Button(button_frame, text="Exit", font=("Arial", 12), bg="tomato", command=self.exit_app).grid(row=0, column=3, padx=10)
+
+        status_frame = tk.Frame(self.root)
+        status_frame.pack(fill=tk.X, side=tk.BOTTOM)
+        self.status_label = tk.Label(status_frame, text="", font=("Arial", 10), anchor="w")
+        self.status_label.pack(side=tk.LEFT, padx=10)
+        self.pending_label = tk.Label(status_frame, text="All bills saved", font=("Arial", 10), fg="darkgreen")
+        self.pending_label.pack(side=tk.RIGHT, padx=10)
+
+    def customer_suggestions(self, text):
+        if self.customers is None:
+            return []
+        return [(f"{c['name']}  |  {c['gstin']}", c) for c in self.customers.match(text)]
+
+    def gstin_suggestions(self, text):
+        if self.customers is None:
+            return []
+        return [(f"{c['gstin']}  |  {c['name']}", c) for c in self.customers.match_gstin(text)]
+
+    def fill_customer(self, customer):
+        self.customer_name.set(customer["name"])
+        self.customer_gst.set(customer["gstin"])
+        self.customer_address_entry.delete("1.0", tk.END)
+        self.customer_address_entry.insert("1.0", customer["address"])
+
+    def item_suggestions(self, text):
+        if self.item_catalog is None:
+            return []
+        return [(f"{i['name']}  |  HSN {i['hsn']}  |  {i['rate']} @ {i['gst']}%", i) for i in self.item_catalog.match(text)]
+
+    def hsn_suggestions(self, text):
+        if self.item_catalog is None:
+            return []
+        return [(f"{i['hsn']}  |  {i['name']}  |  {i['rate']} @ {i['gst']}%", i) for i in self.item_catalog.match_hsn(text)]
+
+    def fill_item(self, item):
+        # Pre-fill everything but the quantity, then move to it
+        for entry, value in ((self.item_name, item["name"]), (self.item_hsn, item["hsn"]),
+                             (self.item_rate, item["rate"]), (self.item_gst, item["gst"])):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
+        self.item_qty.focus_set()
+
+    def import_price_list(self):
+        if not self.check_local():
+            return
+        path = filedialog.askopenfilename(title="Import Price List", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            imported, skipped = self.item_catalog.import_price_list(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to import price list:\n{str(e)}")
+            return
+        message = f"Imported {imported} item(s)."
+        if skipped:
+            message += f"\nSkipped {len(skipped)} invalid row(s): lines {', '.join(map(str, skipped[:10]))}"
+            if len(skipped) > 10:
+                message += ", ..."
+        messagebox.showinfo("Price List", message)
 
     def add_item(self):
         try:
-            name = self.item_name.get()
-            hsn = self.item_hsn.get()
-            qty = int(self.item_qty.get())
-            rate = float(self.item_rate.get())
-            gst = float(self.item_gst.get())
-            total = qty * rate * (1 + gst / 100)
-            self.items.append({"name": name, "hsn": hsn, "qty": qty, "rate": rate, "gst": gst, "total": total})
-            self.tree.insert("", "end", values=(name, hsn, qty, rate, gst, total))
-
-            self.item_name.delete(0, tk.END)
-            self.item_hsn.delete(0, tk.END)
-            self.item_qty.delete(0, tk.END)
-            self.item_rate.delete(0, tk.END)
-            self.item_gst.delete(0, tk.END)
+            line = self.items.add(self.item_name.get(), self.item_hsn.get(), self.item_qty.get(),
+                                  self.item_rate.get(), self.item_gst.get())
         except ValueError:
             messagebox.showerror("Error", "Enter valid numbers for quantity, rate, and GST.")
+            return
+        self.insert_item_rows([line])
+        if self.item_catalog is not None:
+            self.item_catalog.use(line.name)
+
+        self.item_name.delete(0, tk.END)
+        self.item_hsn.delete(0, tk.END)
+        self.item_qty.delete(0, tk.END)
+        self.item_rate.delete(0, tk.END)
+        self.item_gst.delete(0, tk.END)
+
+    def insert_item_rows(self, lines):
+        # One pass of inserts and one totals update, however many lines
+        for line in lines:
+            self.tree.insert("", "end", values=(line.name, line.hsn, line.qty, line.rate, line.gst, from_paise(line.total)))
+        children = self.tree.get_children()
+        if children:
+            self.tree.see(children[-1])
+        self.update_totals_label()
+
+    def refresh_item_rows(self):
+        # Line totals after the CGST/SGST split or IGST flag changed
+        for iid, line in zip(self.tree.get_children(), self.items):
+            self.tree.set(iid, "total", from_paise(line.total))
+        self.update_totals_label()
+
+    def remove_selected_items(self):
+        for iid in sorted(self.tree.selection(), key=self.tree.index, reverse=True):
+            self.items.remove(self.tree.index(iid))
+            self.tree.delete(iid)
+        self.update_totals_label()
+
+    def update_totals_label(self):
+        items = self.items
+        tax = items.cgst + items.sgst + items.igst_total
+        self.totals_label.config(text=f"{len(items)} line(s)    Taxable: {from_paise(items.subtotal):.2f}    "
+                                      f"Tax: {from_paise(tax):.2f}    Total: {from_paise(items.total):.2f}")
+
+    def schedule_retax(self):
+        # CGST/SGST are retyped a keystroke at a time; retax once typing pauses
+        if self.retax_after_id is not None:
+            self.root.after_cancel(self.retax_after_id)
+        self.retax_after_id = self.root.after(300, self.retax_items)
+
+    def retax_items(self):
+        self.retax_after_id = None
+        try:
+            changed = self.items.set_taxes(self.cgst.get(), self.sgst.get(), self.igst.get())
+        except ValueError:
+            self.totals_label.config(text="Enter valid numbers for CGST % and SGST %.")
+            return
+        if changed:
+            self.refresh_item_rows()
+        else:
+            self.update_totals_label()
+
+    def lookup_item(self, name):
+        if self.item_catalog is None:
+            return None
+        return self.item_catalog.get(name)
+
+    def add_pasted_lines(self, text):
+        rows, errors = parse_pasted_lines(text, self.lookup_item)
+        lines = [self.items.add(*row) for row in rows]
+        self.insert_item_rows(lines)
+        if errors:
+            details = "\n".join(f"Line {line_no}: {reason}" for line_no, reason in errors[:10])
+            if len(errors) > 10:
+                details += f"\n... and {len(errors) - 10} more"
+            messagebox.showwarning("Some Lines Skipped", f"Added {len(lines)} line(s), skipped {len(errors)}:\n{details}")
+        else:
+            self.status_label.config(text=f"Added {len(lines)} line(s)")
+
+    def paste_items(self):
+        # Rows copied from a spreadsheet: name, hsn, qty, rate, gst (or name, qty
+        # for items in the catalog)
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            messagebox.showwarning("Clipboard Empty", "Copy item rows from a spreadsheet first.")
+            return
+        self.add_pasted_lines(text)
+
+    def import_items(self):
+        path = filedialog.askopenfilename(title="Import Items", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, "r", newline="", encoding="utf-8-sig") as f:
+                text = f.read()
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to read {path}:\n{str(e)}")
+            return
+        self.add_pasted_lines(text)
 
     def reset_form(self):
-        self.items = []
+        self.items.clear()
         self.customer_name.set("")
         self.customer_gst.set("")
         self.customer_address_entry.delete("1.0", tk.END)
         self.cgst.set("")
         self.sgst.set("")
-        
-        # Increment invoice counter and update number
-        self.invoice_counter += 1
-        self.save_invoice_counter()
-        self.update_invoice_number()
-        
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        messagebox.showinfo("Reset", "Form has been reset successfully. New invoice number generated.")
+        self.igst.set(False)
+        self.tree.delete(*self.tree.get_children())
+        self.update_totals_label()
+        self.bill_date = None
+
+        # An unsaved invoice keeps its number; only a used one is replaced
+        if self.invoice_saved:
+            self.invoice_number.set(self.allocator.next_invoice_number())
+            self.invoice_saved = False
+            messagebox.showinfo("Reset", "Form has been reset successfully. New invoice number generated.")
+        else:
+            messagebox.showinfo("Reset", "Form has been reset successfully.")
 
     def generate_bill_data(self):
         customer_address = self.customer_address_entry.get("1.0", tk.END).strip()
-        total_amount = sum(item['total'] for item in self.items)
-
-        bill_data = {
-            "invoice_number": self.invoice_number.get(),
-            "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "customer": self.customer_name.get(),
-            "gst": self.customer_gst.get(),
-            "address": customer_address,
-            "items": self.items,
-            "cgst": self.cgst.get(),
-            "sgst": self.sgst.get(),
-            "total": total_amount
-        }
-        return bill_data
+        try:
+            if self.items.set_taxes(self.cgst.get(), self.sgst.get(), self.igst.get()):
+                self.refresh_item_rows()
+        except ValueError:
+            messagebox.showerror("Error", "Enter valid numbers for CGST % and SGST %.")
+            return None
+        # The same bill previews, prints and saves with the same date, so it
+        # is rendered (and cached) once
+        if self.bill_date is None:
+            self.bill_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Line amounts and bill totals are already kept by self.items
+        return build_bill(
+            self.invoice_number.get(),
+            self.customer_name.get(),
+            self.customer_gst.get(),
+            customer_address,
+            self.items.as_dicts(),
+            self.cgst.get(),
+            self.sgst.get(),
+            date=self.bill_date,
+            igst=self.igst.get(),
+            totals=self.items.totals(),
+        )
 
     def save_bill(self):
+        if not self.check_ready():
+            return
         if not self.items:
             messagebox.showwarning("No Items", "Add items to save the bill.")
             return
 
-        bill_data = self.generate_bill_data()
+        if self.invoice_saved:
+            # Saved again: a new save gets its own date, which is how the
+            # ledger and reports tell it from the earlier one
+            self.bill_date = None
+        with metrics.span("save_bill"):
+            bill_data = self.generate_bill_data()
+            if bill_data is None:
+                return
 
-        # Save to JSON file
-        if os.path.exists(bills_file):
-            with open(bills_file, "r") as f:
-                all_bills = json.load(f)
+            # Hand the bill to the persistence worker; poll_persistence reports back
+            self.persistence.submit(bill_data)
+        self.invoice_saved = True
+        self.update_pending_label()
+
+    def on_bill_persisted(self, bill_data):
+        # Keep the search index and customer master current once the bill is on disk
+        with self.search_index_pending_lock:
+            if self.search_index_pending is not None:
+                self.search_index_pending.append(bill_data)
+            index = self.search_index
+        if index is not None:
+            index.add(bill_data)
+        self.customers.add_bill(bill_data)
+        self.item_catalog.add_bill(bill_data)
+        self.status_label.config(text=f"Bill {bill_data['invoice_number']} saved")
+        if self.client is None:
+            metrics.record_file_gauges(gauged_files)
+
+    def poll_persistence(self):
+        for bill_data, error in self.persistence.completed():
+            if error is None:
+                self.on_bill_persisted(bill_data)
+            else:
+                messagebox.showerror("Save Failed", f"Bill {bill_data['invoice_number']} could not be saved:\n{error}")
+        self.update_pending_label()
+        self.root.after(100, self.poll_persistence)
+
+    def update_pending_label(self):
+        pending = self.persistence.pending
+        if pending:
+            self.pending_label.config(text=f"Saving... {pending} pending write(s)", fg="darkorange")
         else:
-            all_bills = []
-
-        all_bills.append(bill_data)
-        with open(bills_file, "w") as f:
-            json.dump(all_bills, f, indent=4)
-
-        # Append to transactions Excel
-        self.append_to_transactions(bill_data)
-
-        messagebox.showinfo("Success", f"Bill {bill_data['invoice_number']} saved successfully!\nTransaction added to Excel record.")
-
-    def generate_html_bill(self, bill_data):
-        html = f"""
-        <html><head><style>
-        table, th, td {{border: 1px solid black; border-collapse: collapse; padding: 5px;}}
-        th {{background-color: #f2f2f2;}}
-        .header {{text-align: center;}}
-        .customer-info {{margin-bottom: 15px;}}
-        </style></head><body>
-        <div class="header">
-            <h2>company name</h2>
-            <p>Deals in Crane, Hose Pipes & Fittings<br>GSTIN: gst number | +91-9752499xxx<br>Address: abcd</p>
-        </div>
-        <hr>
-        <div class="customer-info">
-            <p><b>Invoice No:</b> {bill_data['invoice_number']}</p>
-            <p><b>Customer:</b> {bill_data['customer']}</p>
-            <p><b>GSTIN:</b> {bill_data['gst']}</p>
-            <p><b>Address:</b> {bill_data['address']}</p>
-            <p><b>Date:</b> {bill_data['date']}</p>
-        </div>
-        <table><tr><th>S. No.</th><th>Item</th><th>HSN</th><th>Qty</th><th>Rate</th><th>GST</th><th>Total</th></tr>"""
-
-        for idx, item in enumerate(bill_data['items'], start=1):
-            html += f"<tr><td>{idx}</td><td>{item['name']}</td><td>{item['hsn']}</td><td>{item['qty']}</td><td>{item['rate']}</td><td>{item['gst']}%</td><td>{item['total']:.2f}</td></tr>"
-
-        html += f"""</table><br><b>CGST:</b> {bill_data['cgst']}% <b>SGST:</b> {bill_data['sgst']}%<br><br><b>Total Amount: ₹{bill_data['total']:.2f}</b><br></body></html>"""
-        return html
+            self.pending_label.config(text="All bills saved", fg="darkgreen")
+
+    def get_print_spool(self):
+        if self.print_spool is None:
+            self.print_spool = PrintSpool()
+        return self.print_spool
+
+    def open_bill_document(self, bill_data):
+        # Rendered once per distinct bill; after that the cached file is opened
+        webbrowser.open(f"file://{os.path.abspath(self.get_print_spool().open_bill(bill_data))}")
 
     def preview_bill(self):
         if not self.items:
@@ -351,13 +754,9 @@ class BillingApp:
             return
 
         bill_data = self.generate_bill_data()
-        html = self.generate_html_bill(bill_data)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8") as f:
-            f.write(html)
-            temp_path = f.name
-
-        webbrowser.open(f"file://{temp_path}")
+        if bill_data is None:
+            return
+        self.open_bill_document(bill_data)
 
     def print_bill(self):
         if not self.items:
@@ -365,79 +764,41 @@ class BillingApp:
             return
 
         bill_data = self.generate_bill_data()
-        html = self.generate_html_bill(bill_data)
-
-        # Create a temporary HTML file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8") as f:
-            f.write(html)
-            temp_path = f.name
+        if bill_data is None:
+            return
+        path = self.get_print_spool().open_bill(bill_data)
 
         # Open in browser and trigger print
         browser = webbrowser.get()
-        browser.open_new_tab(f"file://{temp_path}")
-
-    def perform_bill_search(self, search_type, result_tree):
-        # Implemented basic search logic
-        for item in result_tree.get_children():
-            result_tree.delete(item)
-    def preview_selected_bill(self, result_tree):
-        selected_item = result_tree.selection()
-        if not selected_item:
-            messagebox.showwarning("No Selection", "Please select a bill to preview.")
-    def show_search_window(self):
-        # Corrected redefinition of show_search_window
-        search_win = tk.Toplevel(self.root)
-        search_win.title("Search Bills")
-        search_win.geometry("800x500")
-
-        tk.Label(search_win, text="Search By:", font=("Arial", 12)).grid(row=0, column=0, padx=10, pady=10)
-        search_type = ttk.Combobox(search_win, values=["Invoice Number", "Customer Name", "Date"], state="readonly", width=20)
-        search_type.grid(row=0, column=1, padx=10)
-
-        search_term = tk.StringVar()
-        tk.Entry(search_win, textvariable=search_term, font=("Arial", 12), width=30).grid(row=0, column=2, padx=10)
-
-        columns = ("Invoice", "Customer", "Date", "Total")
-        result_tree = ttk.Treeview(search_win, columns=columns, show="headings")
-        for col in columns:
-            result_tree.heading(col, text=col)
-        result_tree.grid(row=1, column=0, columnspan=3, sticky="nsew")
-
-        scrollbar = ttk.Scrollbar(search_win, orient="vertical", command=result_tree.yview)
-        result_tree.configure(yscroll=scrollbar.set)
-        scrollbar.grid(row=1, column=3, sticky='ns')
-
-        tk.Button(search_win, text="Search", font=("Arial", 12), command=lambda: self.perform_bill_search(search_type.get(), result_tree)).grid(row=0, column=3, padx=10)
-
-        result_tree.bind("<Double-1>", lambda event: self.preview_selected_bill(result_tree))
-
-        # Define selected_item properly
-        selected_item = result_tree.selection()
-        if selected_item:
-            item = result_tree.item(selected_item[0])
-            invoice_number = item['values'][0]
-
-            try:
-                with open(bills_file, "r") as f:
-                    all_bills = json.load(f)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load bills: {e}")
-                return
-
-            for bill in all_bills:
-                if bill['invoice_number'] == invoice_number:
-                    html = self.generate_html_bill(bill)
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8") as f:
-                        f.write(html)
-                        temp_path = f.name
-                    webbrowser.open(f"file://{temp_path}")
-                    break
-
-    def preview_selected_bill(self, result_tree):
-        # Placeholder for the preview logic
-        pass
+        browser.open_new_tab(f"file://{os.path.abspath(path)}")
+
+    def get_search_index(self):
+        # Built from the bill store on first use, then kept current by save_bill.
+        # May be called from the search thread, hence the lock.
+        with self.search_index_lock:
+            if self.search_index is None and self.client is not None:
+                self.search_index = RemoteSearchIndex(self.client)
+            elif self.search_index is None:
+                # The store is read as of now; bills saved during the build
+                # are queued by on_bill_persisted and added afterwards
+                with self.search_index_pending_lock:
+                    self.search_index_pending = []
+                index = None
+                try:
+                    with metrics.span("search_index.build"):
+                        index = BillSearchIndex.for_store(self.bill_store)
+                finally:
+                    with self.search_index_pending_lock:
+                        if index is not None:
+                            for bill_data in self.search_index_pending:
+                                index.add(bill_data)
+                            self.search_index = index
+                        self.search_index_pending = None
+        return self.search_index
 
     def show_search_window(self):
+        if not self.check_ready():
+            return
         search_window = tk.Toplevel(self.root)
         search_window.title("Search Bills")
         search_window.geometry("800x600")
@@ -447,11 +808,18 @@ class BillingApp:
         search_frame = tk.Frame(search_window)
         search_frame.pack(pady=10)
         
-        tk.Label(search_frame, text="Search Term:").grid(row=0, column=0)
+        tk.Label(search_frame, text="Search By:").grid(row=0, column=0)
+        self.search_type = ttk.Combobox(search_frame, values=["All", "Invoice Number", "Customer Name", "GSTIN"], state="readonly", width=15)
+        self.search_type.current(0)
+        self.search_type.grid(row=0, column=1, padx=5)
+        self.search_type.bind("<<ComboboxSelected>>", lambda event: self.search_bills(search_window))
+
+        tk.Label(search_frame, text="Search Term:").grid(row=0, column=2)
         search_entry = tk.Entry(search_frame, textvariable=self.search_term, width=40)
-        search_entry.grid(row=0, column=1)
+        search_entry.grid(row=0, column=3)
+        search_entry.bind("<KeyRelease>", lambda event: self.schedule_search(search_window))
         
-        tk.Button(search_frame, text="Search", command=lambda: self.search_bills(search_window)).grid(row=0, column=2, padx=10)
+        tk.Button(search_frame, text="Search", command=lambda: self.search_bills(search_window)).grid(row=0, column=4, padx=10)
         
         # Date range filters
         date_frame = tk.Frame(search_window)
@@ -461,81 +829,167 @@ class BillingApp:
         self.from_date = tk.Entry(date_frame, width=15)
         self.from_date.grid(row=0, column=1, padx=5)
         self.from_date.insert(0, datetime.now().strftime('%Y-%m-01'))
+        self.from_date.bind("<KeyRelease>", lambda event: self.schedule_search(search_window))
         
         tk.Label(date_frame, text="To:").grid(row=0, column=2)
         self.to_date = tk.Entry(date_frame, width=15)
         self.to_date.grid(row=0, column=3, padx=5)
         self.to_date.insert(0, datetime.now().strftime('%Y-%m-%d'))
+        self.to_date.bind("<KeyRelease>", lambda event: self.schedule_search(search_window))
         
-        # Results treeview
-        columns = ("Invoice No", "Date", "Customer", "GSTIN", "Total")
-        self.search_tree = ttk.Treeview(search_window, columns=columns, show="headings")
-        for col in columns:
-            self.search_tree.heading(col, text=col)
-            self.search_tree.column(col, width=150)
-        self.search_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        # Results, loaded a page at a time as the list is scrolled
+        columns = [("invoice", "Invoice No"), ("date", "Date"), ("customer", "Customer"), ("gstin", "GSTIN"), ("total", "Total")]
+        self.results_view = PagedResultsView(search_window, columns, self.search_result_rows,
+                                             on_sort=lambda sort_by, descending: self.search_bills(search_window))
+        self.results_view.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.results_view.tree.bind("<Double-1>", lambda event: self.view_selected_bill(search_window))
         
-        # View button
-        tk.Button(search_window, text="View Selected Bill", 
-                 command=lambda: self.view_selected_bill(search_window)).pack(pady=10)
+        # View / print buttons
+        action_frame = tk.Frame(search_window)
+        action_frame.pack(pady=10)
+        tk.Button(action_frame, text="View Selected Bill", 
+                 command=lambda: self.view_selected_bill(search_window)).grid(row=0, column=0, padx=10)
+        tk.Button(action_frame, text="Print Bills",
+                 command=lambda: self.print_search_results(search_window)).grid(row=0, column=1, padx=10)
         
-        # Load all bills initially
         self.search_bills(search_window)
 
-def show_search_window(self):
-    search_win = tk.Toplevel(self.root)
-    search_win.title("Search Bills")
-    search_win.geometry("800x500")
-
-    tk.Label(search_win, text="Search By:", font=("Arial", 12)).grid(row=0, column=0, padx=10, pady=10)
-    search_type = ttk.Combobox(search_win, values=["Invoice Number", "Customer Name", "Date"], state="readonly", width=20)
-    search_type.grid(row=0, column=1, padx=10)
-
-    tk.Entry(search_win, textvariable=self.search_term, font=("Arial", 12), width=30).grid(row=0, column=2, padx=10)
-    tk.Button(search_win, text="Search", font=("Arial", 12), command=lambda: self.perform_bill_search(search_type.get(), result_tree)).grid(row=0, column=3)
-
-    columns = ("Invoice", "Customer", "Date", "Total")
-    result_tree = ttk.Treeview(search_win, columns=columns, show="headings")
-    for col in columns:
-        result_tree.heading(col, text=col)
-
-    scrollbar = ttk.Scrollbar(search_win, orient="vertical", command=result_tree.yview)
-    result_tree.configure(yscroll=scrollbar.set)
-    scrollbar.grid(row=1, column=4, sticky='ns')
-    result_tree.grid(row=1, column=0, columnspan=4, sticky="nsew")
+    def search_result_rows(self, invoice_numbers):
+        rows = []
+        for invoice_number, date, customer, gstin, total in self.search_index.summaries_for(invoice_numbers):
+            rows.append((invoice_number, date, customer, gstin, f"{float(total):.2f}"))
+        return rows
+
+    def schedule_search(self, window):
+        # Wait for a pause in typing before querying
+        if self.search_after_id is not None:
+            window.after_cancel(self.search_after_id)
+        self.search_after_id = window.after(150, lambda: self.search_bills(window))
+
+    def search_bills(self, window):
+        self.search_after_id = None
+
+        # Cancel whatever query is still running; its results are dropped
+        if self.search_cancel is not None:
+            self.search_cancel.set()
+        cancel = threading.Event()
+        self.search_cancel = cancel
+
+        search_type = self.search_type.get()
+        view = self.results_view
+        query = dict(
+            term=self.search_term.get(),
+            field=None if search_type == "All" else search_type,
+            date_from=self.from_date.get().strip(),
+            date_to=self.to_date.get().strip(),
+            sort_by=view.sort_by,
+            descending=view.descending,
+            cancel=cancel,
+        )
+        view.show_message("Searching...")
+
+        def on_done(results, error):
+            if cancel.is_set() or not view.winfo_exists():
+                return
+            if isinstance(error, SearchCancelled):
+                return
+            if error is not None:
+                view.show_message(f"Search failed: {error}")
+                return
+            view.show_results(results)
 
-    # Double click to preview bill
-    result_tree.bind("<Double-1>", lambda event: self.preview_selected_bill(result_tree))
+        def run_search():
+            index = self.get_search_index()
+            with metrics.span("search"):
+                return index.search(**query)
 
+        self.run_in_background(run_search, on_done)
 
-def view_selected_bill(self, window):
-        selected_item = self.search_tree.selection()
-        if not selected_item:
-            messagebox.showwarning("No Selection", "Please select a bill to view")
+    def view_selected_bill(self, window):
+        selected = self.results_view.selected_ids()
+        if not selected:
+            messagebox.showwarning("No Selection", "Please select a bill to view", parent=window)
             return
         
-        item = self.search_tree.item(selected_item[0])
-        invoice_number = item['values'][0]
-        
-        try:
-            with open(bills_file, "r") as f:
-                all_bills = json.load(f)
-        except:
-            all_bills = []
-        
-        for bill in all_bills:
-            if bill['invoice_number'] == invoice_number:
-                html = self.generate_html_bill(bill)
-                
-                # Create a temporary HTML file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8") as f:
-                    f.write(html)
-                    temp_path = f.name
-
-                webbrowser.open(f"file://{temp_path}")
-                break
+        bill = self.bill_store.get(selected[0])
+        if bill:
+            self.open_bill_document(bill)
+
+    def print_search_results(self, window):
+        # Selected bills, or every bill the search found when nothing is
+        # selected, rendered into one document with a page per invoice
+        invoice_numbers = self.results_view.selected_ids() or self.results_view.ids
+        if not invoice_numbers:
+            messagebox.showwarning("No Bills", "There are no bills to print", parent=window)
+            return
+        bills = (self.bill_store.get(number) for number in invoice_numbers)
+        spool = self.get_print_spool()
+
+        def on_done(result, error):
+            if error is not None:
+                messagebox.showerror("Print Failed", f"Could not prepare the invoices: {error}", parent=window)
+                return
+            webbrowser.open(f"file://{os.path.abspath(result[0])}")
+
+        # Bills already rendered are copied from the cache, the rest rendered
+        # into it, off the Tk thread
+        self.run_in_background(
+            lambda: spool.submit((bill for bill in bills if bill), f"{len(invoice_numbers)} invoices"), on_done)
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from service import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "gst-report":
+        from gst_report import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "retax":
+        from ledger import main
+        sys.exit(main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-reports":
+        # Caught up from the write-ahead log first, so the rebuilt months
+        # can be stamped with its last lsn
+        try:
+            wal, bill_store, ledger, rollups, _ = open_views()
+        except WalInUse as e:
+            print(e)
+            sys.exit(1)
+        months = rebuild_all(rollups, ledger, lsn=wal.lsn)
+        bill_store.close()
+        ledger.close()
+        wal.close()
+        print(f"Rebuilt monthly rollups for {len(months)} month(s)")
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "profile-startup":
+        # With a display, the time until the form is drawn and the data
+        # files are loaded; then import times from a fresh interpreter
+        startup_timer.mark("imports")
+        try:
+            root = tk.Tk()
+        except tk.TclError:
+            write_startup_report(import_profile("bill_prototype"), {})
+            sys.exit(0)
+        app = BillingApp(root)
+
+        def wait_until_ready():
+            if app.ready:
+                app.exit_app()
+            else:
+                root.after(10, wait_until_ready)
+
+        root.after(10, wait_until_ready)
+        root.mainloop()
+        write_startup_report(import_profile("bill_prototype"), startup_timer.marks)
+        sys.exit(0)
+
+    startup_timer.mark("imports")
     root = tk.Tk()
     app = BillingApp(root)
     root.mainloop()
+    # However the window was closed, don't drop queued bills
+    if app.persistence is not None:
+        app.persistence.close()
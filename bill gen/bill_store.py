@@ -0,0 +1,499 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+
+legacy_bills_file = "bills.json"
+bills_log_file = "bills.jsonl"
+bills_index_file = "bills.idx"
+bills_partition_folder = "bills"
+
+
+class BillStore:
+    # Common interface for bill storage engines. Bills are plain dicts keyed
+    # by their "invoice_number"; saving the same invoice again replaces it.
+
+    def append(self, bill):
+        raise NotImplementedError
+
+    def get(self, invoice_number):
+        raise NotImplementedError
+
+    def invoice_numbers(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        for invoice_number in self.invoice_numbers():
+            yield self.get(invoice_number)
+
+    def __contains__(self, invoice_number):
+        return self.get(invoice_number) is not None
+
+    def __len__(self):
+        return len(self.invoice_numbers())
+
+    def sync(self):
+        pass
+
+    def durable_files(self):
+        # Append-only files the write-ahead log checkpoint can cut back to
+        return []
+
+    def durable_folders(self):
+        # {folder: suffixes} whose files created after a checkpoint are
+        # dropped when recovering from it
+        return {}
+
+    def seal_closed(self):
+        # Compact finished partitions, for engines that have them
+        return []
+
+    def close(self):
+        pass
+
+
+class JsonListBillStore(BillStore):
+    # The original format: a single JSON list rewritten on every save.
+    # Kept for reading old data and for anyone who still wants the flat file.
+
+    def __init__(self, path=legacy_bills_file):
+        self.path = path
+
+    def _load(self):
+        # A missing file is an empty store; a damaged one raises ValueError
+        # rather than being taken for empty and overwritten by the next save
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def append(self, bill):
+        all_bills = [b for b in self._load() if b.get("invoice_number") != bill["invoice_number"]]
+        all_bills.append(bill)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(all_bills, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get(self, invoice_number):
+        # Old files hold every save of an invoice; the last one is current
+        for bill in reversed(self._load()):
+            if bill.get("invoice_number") == invoice_number:
+                return bill
+        return None
+
+    def invoice_numbers(self):
+        return [b.get("invoice_number") for b in self._load()]
+
+    def __iter__(self):
+        return iter(self._load())
+
+
+class JsonlBillStore(BillStore):
+    # Append-only log with one JSON bill per line, plus a side index of
+    # "<invoice>\t<offset>\t<length>" lines. A save appends one line to each
+    # file, and a lookup is a single seek + read of the indexed record.
+
+    def __init__(self, path=bills_log_file, index_path=bills_index_file):
+        self.path = path
+        self.index_path = index_path
+        self.index = {}
+        self._load_index()
+        self._log = open(self.path, "ab")
+        self._idx = open(self.index_path, "a", encoding="utf-8")
+        # One read handle shared by every thread that looks bills up (UI,
+        # search, print and persistence workers); seek+read under a lock
+        self._reader = None
+        self._read_lock = threading.Lock()
+
+    def _load_index(self):
+        indexed_end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 3 or not (parts[1].isdigit() and parts[2].isdigit()):
+                        continue  # torn last line from a crash
+                    offset, length = int(parts[1]), int(parts[2])
+                    self.index[parts[0]] = (offset, length)
+                    indexed_end = max(indexed_end, offset + length)
+
+        log_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if log_size != indexed_end or not os.path.exists(self.index_path):
+            # Index and log disagree after a crash: rebuild from the log
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        # Index every record in the log, and drop a partially written final
+        # line so the next append starts cleanly.
+        self.index = {}
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+        good_end = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    bill = json.loads(line)
+                except ValueError:
+                    break
+                self.index[bill["invoice_number"]] = (offset, len(line))
+                offset += len(line)
+                good_end = offset
+        if os.path.getsize(self.path) > good_end:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            for invoice_number, (offset, length) in sorted(self.index.items(), key=lambda kv: kv[1][0]):
+                f.write(f"{invoice_number}\t{offset}\t{length}\n")
+
+    def append(self, bill):
+        line = (json.dumps(bill, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        offset = self._log.seek(0, os.SEEK_END)
+        self._log.write(line)
+        self._log.flush()
+        self.index[bill["invoice_number"]] = (offset, len(line))
+        self._idx.write(f"{bill['invoice_number']}\t{offset}\t{len(line)}\n")
+        self._idx.flush()
+
+    def get(self, invoice_number):
+        entry = self.index.get(invoice_number)
+        if entry is None:
+            return None
+        with self._read_lock:
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(entry[0])
+            line = self._reader.read(entry[1])
+        return json.loads(line)
+
+    def invoice_numbers(self):
+        return [inv for inv, _ in sorted(self.index.items(), key=lambda kv: kv[1][0])]
+
+    def __contains__(self, invoice_number):
+        return invoice_number in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def sync(self):
+        os.fsync(self._log.fileno())
+        os.fsync(self._idx.fileno())
+
+    def durable_files(self):
+        return [self.path, self.index_path]
+
+    def close(self):
+        with self._read_lock:
+            for f in (self._log, self._idx, self._reader):
+                if f is not None:
+                    f.close()
+            self._reader = None
+
+
+def bill_month(bill):
+    # Partition key: "YYYY-MM" from the bill date
+    return str(bill.get("date", ""))[:7] or "undated"
+
+
+segment_magic = b"BSG1"
+_trailer = struct.Struct("<Q4s")
+
+
+def write_segment(path, bills):
+    # Sealed partition: each bill compressed on its own so any one can be
+    # read without the rest, then a compressed footer of
+    # [invoice, offset, length, date, customer, gstin, total] in date order,
+    # then the footer offset and a magic number.
+    bills = sorted(bills, key=lambda bill: str(bill.get("date", "")))
+    entries, offset = [], 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for bill in bills:
+            record = zlib.compress(json.dumps(bill, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            f.write(record)
+            entries.append([bill["invoice_number"], offset, len(record), str(bill.get("date", "")),
+                            bill.get("customer", ""), bill.get("gst", ""), bill.get("total", 0)])
+            offset += len(record)
+        f.write(zlib.compress(json.dumps(entries, ensure_ascii=False).encode("utf-8")))
+        f.write(_trailer.pack(offset, segment_magic))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SealedSegment:
+    # Read-only view of a sealed partition, memory-mapped; only the footer
+    # is decoded up front
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_offset, magic = _trailer.unpack(self._map[-_trailer.size:])
+        if magic != segment_magic:
+            raise ValueError(f"{path} is not a sealed bill segment")
+        self.entries = json.loads(zlib.decompress(self._map[footer_offset:-_trailer.size]))
+        self.index = {entry[0]: (entry[1], entry[2]) for entry in self.entries}
+
+    def get(self, invoice_number):
+        entry = self.index.get(invoice_number)
+        if entry is None:
+            return None
+        offset, length = entry
+        return json.loads(zlib.decompress(self._map[offset:offset + length]))
+
+    def summaries(self):
+        # (invoice, date, customer, gstin, total) without decompressing bills
+        return [tuple(entry[:1] + entry[3:]) for entry in self.entries]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class PartitionedBillStore(BillStore):
+    # One partition per month under bills/. The current month, and any
+    # closed month a bill is saved into again, is an open JSONL log with its
+    # offset index (<month>.jsonl/.idx, as JsonlBillStore). seal_closed()
+    # compacts a finished month into a read-only <month>.seg holding only the
+    # latest save of each invoice. bills/invoices.idx appends
+    # "<invoice>\t<month>" whenever an invoice lands in a new month (last line
+    # wins), so a lookup opens just the one partition the invoice is in.
+    # Partitions are opened on first use.
+
+    def __init__(self, folder=bills_partition_folder):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+        self.directory_path = os.path.join(folder, "invoices.idx")
+        self.directory = {}
+        self._logs = {}
+        self._segments = {}
+        # Saves, lookups and searches may come from different threads
+        self._lock = threading.RLock()
+        self._load_directory()
+        self._dir = open(self.directory_path, "a", encoding="utf-8")
+
+    def _path(self, month, suffix):
+        return os.path.join(self.folder, month + suffix)
+
+    def _load_directory(self):
+        if not os.path.exists(self.directory_path):
+            if self.months():
+                self._rebuild_directory()
+            return
+        with open(self.directory_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # torn last line from a crash
+                invoice_number, _, month = line.rstrip("\n").partition("\t")
+                self.directory[invoice_number] = month
+
+    def _rebuild_directory(self):
+        # From the partitions themselves; where an invoice is in several
+        # months, the save with the latest date wins
+        dates = {}
+        for month in self.months():
+            for invoice_number, date, *_ in self._partition_summaries(month, latest_only=False):
+                if date >= dates.get(invoice_number, ""):
+                    dates[invoice_number] = date
+                    self.directory[invoice_number] = month
+        with open(self.directory_path, "w", encoding="utf-8") as f:
+            for invoice_number, month in self.directory.items():
+                f.write(f"{invoice_number}\t{month}\n")
+
+    def months(self):
+        return sorted({name.rsplit(".", 1)[0] for name in os.listdir(self.folder)
+                       if name.endswith((".seg", ".jsonl"))})
+
+    def months_between(self, date_from=None, date_to=None):
+        # Partitions that can hold bills dated date_from..date_to
+        return [month for month in self.months()
+                if (not date_from or month >= date_from[:7]) and (not date_to or month <= date_to[:7])]
+
+    def _log(self, month, create=False):
+        log = self._logs.get(month)
+        if log is None and (create or os.path.exists(self._path(month, ".jsonl"))):
+            log = self._logs[month] = JsonlBillStore(self._path(month, ".jsonl"), self._path(month, ".idx"))
+        return log
+
+    def _segment(self, month):
+        segment = self._segments.get(month)
+        if segment is None and os.path.exists(self._path(month, ".seg")):
+            segment = self._segments[month] = SealedSegment(self._path(month, ".seg"))
+        return segment
+
+    def append(self, bill):
+        month = bill_month(bill)
+        with self._lock:
+            self._log(month, create=True).append(bill)
+            if self.directory.get(bill["invoice_number"]) != month:
+                self.directory[bill["invoice_number"]] = month
+                self._dir.write(f"{bill['invoice_number']}\t{month}\n")
+                self._dir.flush()
+
+    def _get(self, month, invoice_number):
+        with self._lock:
+            log = self._log(month)
+            if log is not None and invoice_number in log:
+                return log.get(invoice_number)
+            segment = self._segment(month)
+            return segment.get(invoice_number) if segment is not None else None
+
+    def get(self, invoice_number):
+        month = self.directory.get(invoice_number)
+        return self._get(month, invoice_number) if month is not None else None
+
+    def invoice_numbers(self):
+        return list(self.directory)
+
+    def __contains__(self, invoice_number):
+        return invoice_number in self.directory
+
+    def __len__(self):
+        return len(self.directory)
+
+    def _partition_invoices(self, month, latest_only=True):
+        # Invoice numbers in the partition, open log first (it wins over the
+        # sealed segment), leaving out those saved again in another month
+        seen = set()
+        for source in (self._log(month), self._segment(month)):
+            if source is None:
+                continue
+            for invoice_number in (source.invoice_numbers() if isinstance(source, JsonlBillStore) else source.index):
+                if invoice_number in seen or latest_only and self.directory.get(invoice_number) != month:
+                    continue
+                seen.add(invoice_number)
+                yield invoice_number
+
+    def month_bills(self, month):
+        with self._lock:
+            invoice_numbers = list(self._partition_invoices(month))
+        for invoice_number in invoice_numbers:
+            yield self._get(month, invoice_number)
+
+    def _partition_summaries(self, month, latest_only=True):
+        logged = self._log(month)
+        segment = self._segment(month)
+        sealed = {entry[0]: entry for entry in segment.summaries()} if segment is not None else {}
+        for invoice_number in self._partition_invoices(month, latest_only):
+            if logged is not None and invoice_number in logged:
+                bill = logged.get(invoice_number)
+                yield (invoice_number, str(bill.get("date", "")), bill.get("customer", ""),
+                       bill.get("gst", ""), bill.get("total", 0))
+            else:
+                yield sealed[invoice_number]
+
+    def month_summaries(self, month):
+        # Search summaries of the month's bills; a sealed partition answers
+        # from its footer without decompressing any bill
+        with self._lock:
+            return list(self._partition_summaries(month))
+
+    def __iter__(self):
+        for month in self.months():
+            yield from self.month_bills(month)
+
+    def seal(self, month):
+        with self._lock:
+            self._seal(month)
+
+    def _seal(self, month):
+        bills = list(self.month_bills(month))
+        # Closed first: Windows cannot replace a file that is mapped
+        for cache in (self._logs, self._segments):
+            opened = cache.pop(month, None)
+            if opened is not None:
+                opened.close()
+        if bills:
+            write_segment(self._path(month, ".seg"), bills)
+        elif os.path.exists(self._path(month, ".seg")):
+            os.remove(self._path(month, ".seg"))
+        for suffix in (".jsonl", ".idx"):
+            if os.path.exists(self._path(month, suffix)):
+                os.remove(self._path(month, suffix))
+
+    def seal_closed(self, current_month=None):
+        # Seal every month before the current one that has an open log
+        current_month = current_month or datetime.now().strftime("%Y-%m")
+        sealed = [month for month in self.months()
+                  if month < current_month and os.path.exists(self._path(month, ".jsonl"))]
+        for month in sealed:
+            self.seal(month)
+        return sealed
+
+    def sync(self):
+        with self._lock:
+            for log in self._logs.values():
+                log.sync()
+            self._dir.flush()
+            os.fsync(self._dir.fileno())
+
+    def durable_files(self):
+        return [self.directory_path] + [os.path.join(self.folder, name) for name in sorted(os.listdir(self.folder))
+                                        if name.endswith((".jsonl", ".idx")) and name != "invoices.idx"]
+
+    def durable_folders(self):
+        return {self.folder: [".jsonl", ".idx"]}
+
+    def close(self):
+        for opened in list(self._logs.values()) + list(self._segments.values()):
+            opened.close()
+        self._logs, self._segments = {}, {}
+        self._dir.close()
+
+
+bill_store_engines = {
+    "json": JsonListBillStore,
+    "jsonl": JsonlBillStore,
+    "partitioned": PartitionedBillStore,
+}
+
+
+def open_bill_store(engine=None):
+    engine = engine or os.environ.get("BILL_STORE_ENGINE", "jsonl")
+    if engine not in bill_store_engines:
+        raise ValueError(f"Unknown bill store engine: {engine}")
+    return bill_store_engines[engine]()
+
+
+def migrate_legacy_bills(store, legacy_path=legacy_bills_file):
+    # One-time import of the old bills.json list. The file is renamed once
+    # imported so later startups skip it. The old app appended every save of
+    # an invoice, so bills go in in file order and the last save wins;
+    # importing again after a crash gives the same result.
+    if isinstance(store, JsonListBillStore) or not os.path.exists(legacy_path):
+        return 0
+    migrated = 0
+    for bill in JsonListBillStore(legacy_path):
+        store.append(bill)
+        migrated += 1
+    store.sync()
+    os.replace(legacy_path, legacy_path + ".migrated")
+    return migrated
+
+
+def migrate_bill_log(store, log_path=bills_log_file, index_path=bills_index_file):
+    # Moving to the partitioned engine: import bills.jsonl once, then rename
+    # it (and its index) so later startups skip it
+    if not isinstance(store, PartitionedBillStore) or not os.path.exists(log_path):
+        return 0
+    migrated = 0
+    log = JsonlBillStore(log_path, index_path)
+    for bill in log:
+        if bill.get("invoice_number") not in store:
+            store.append(bill)
+            migrated += 1
+    log.close()
+    store.sync()
+    for path in (log_path, index_path):
+        if os.path.exists(path):
+            os.replace(path, path + ".migrated")
+    return migrated
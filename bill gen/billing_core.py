@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from renderer import get_renderer
+from tax import compute_bill_taxes
+
+# Billing logic shared by the Tk app and the batch runner. Nothing in here
+# touches tkinter, so it can run in worker processes.
+
+invoice_prefix = "SS-"
+
+
+def format_invoice_number(counter):
+    return f"{invoice_prefix}{counter:04d}"
+
+
+def parse_invoice_number(invoice_number):
+    # ValueError for anything format_invoice_number could not have produced
+    digits = invoice_number[len(invoice_prefix):] if invoice_number.startswith(invoice_prefix) else ""
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"{invoice_number!r} is not an invoice number")
+    return int(digits)
+
+
+def make_item(name, hsn, qty, rate, gst):
+    # Raises ValueError for non-numeric quantity, rate or GST
+    item = {"name": name, "hsn": hsn, "qty": int(qty), "rate": float(rate), "gst": float(gst)}
+    compute_bill_taxes([item])
+    return item
+
+
+def build_bill(invoice_number, customer, gst, address, items, cgst="", sgst="", date=None, igst=False, totals=None):
+    # Line and bill amounts come from the paise-exact tax engine; cgst/sgst
+    # stay the rate strings as entered, the *_amount fields hold the rupees.
+    # Pass totals when the items are already taxed (LineItems keeps them).
+    if totals is None:
+        totals = compute_bill_taxes(items, cgst, sgst, igst)
+    return {
+        "invoice_number": invoice_number,
+        "date": date or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "customer": customer,
+        "gst": gst,
+        "address": address,
+        "items": items,
+        "cgst": cgst,
+        "sgst": sgst,
+        "igst": igst,
+        "subtotal": totals["subtotal"],
+        "cgst_amount": totals["cgst_amount"],
+        "sgst_amount": totals["sgst_amount"],
+        "igst_amount": totals["igst_amount"],
+        "total": totals["total"]
+    }
+
+
+def render_html_bill(bill_data):
+    return get_renderer().render(bill_data)
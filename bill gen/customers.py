@@ -0,0 +1,105 @@
+import json
+import os
+
+from search_index import NameIndex, normalize
+
+customers_file = "customers.json"
+
+# Customer master derived from bill history: one entry per customer name with
+# the GSTIN and address from their latest bill. A snapshot is kept in
+# customers.json together with the bill count it was built from; when the
+# bill store has grown behind its back (e.g. a batch run), the master is
+# rebuilt from the bills on the next load.
+
+
+class CustomerMaster:
+    def __init__(self, path=customers_file):
+        self.path = path
+        self.customers = {}
+        self.index = NameIndex("gstin")
+        self.bill_count = 0
+
+    def _merge(self, bill_data):
+        # Returns (key, previous entry, new entry) or None for nameless bills
+        name = str(bill_data.get("customer", "")).strip()
+        key = normalize(name)
+        if not key:
+            return None
+        date = str(bill_data.get("date", ""))
+        previous = self.customers.get(key)
+        customer = dict(previous) if previous else {"name": name, "gstin": "", "address": "", "last_date": "", "bills": 0}
+        customer["bills"] += 1
+        if date >= customer["last_date"]:
+            customer.update(name=name, gstin=str(bill_data.get("gst", "")).strip(),
+                            address=str(bill_data.get("address", "")).strip(), last_date=date)
+        self.customers[key] = customer
+        return key, previous, customer
+
+    def build(self, bills):
+        self.customers = {}
+        count = 0
+        for bill_data in bills:
+            self._merge(bill_data)
+            count += 1
+        self.bill_count = count
+        self.index.bulk_load(self.customers)
+        return self
+
+    def add_bill(self, bill_data):
+        merged = self._merge(bill_data)
+        if merged is not None:
+            self.index.replace(*merged)
+
+    def load(self, bill_store):
+        # Snapshot if it was saved at the store's current bill count,
+        # otherwise rebuild from the bills and save
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("bill_count") == len(bill_store):
+                self.customers = data["customers"]
+                self.bill_count = data["bill_count"]
+                self.index.bulk_load(self.customers)
+                return self
+        except (OSError, ValueError, KeyError):
+            pass
+        self.build(bill_store)
+        self.save(self.bill_count)
+        return self
+
+    def save(self, bill_count):
+        # bill_count: len() of the bill store this master is now in step with
+        self.bill_count = bill_count
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"bill_count": bill_count, "customers": self.customers}, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.customers)
+
+    def get(self, name):
+        return self.customers.get(normalize(name))
+
+    def match(self, text, limit=10, scan=500):
+        # Customers whose name (or a word of it) starts with text, most
+        # frequent first. At most `scan` index keys are looked at, so a
+        # one-letter prefix over tens of thousands of customers stays cheap.
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        found = self.index.names.prefix(prefix, scan)
+        ranked = sorted((self.customers[key] for key in found),
+                        key=lambda c: (not normalize(c["name"]).startswith(prefix), -c["bills"], c["name"]))
+        return ranked[:limit]
+
+    def match_gstin(self, text, limit=10):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        found = []
+        for key in self.index.codes.iter_keys(prefix):
+            found.extend(self.index.codes.postings[key])
+            if len(found) >= limit:
+                break
+        return [self.customers[key] for key in found[:limit]]
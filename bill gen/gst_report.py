@@ -0,0 +1,250 @@
+import argparse
+import csv
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from ledger import TransactionLedger
+from rollups import reports_folder
+from tax import from_paise, retax_rows, to_basis_points, to_paise
+
+hsn_cache_folder = os.path.join(reports_folder, "hsn")
+hsn_cache_version = 1
+unregistered = "Unregistered"
+chunk_rows = 5000
+
+# HSN-wise GST summary (GSTR-1 style): quantity, taxable value, CGST, SGST,
+# IGST and total per month, HSN code, GST rate and customer GSTIN.
+#
+#   python bill_prototype.py gst-report --from 2025-04 --to 2026-03
+#
+# Each monthly ledger segment is streamed record by record into a
+# per-invoice state (monthly_reports/hsn/<YYYY-MM>.state.json), which records
+# how many bytes of the segment it covers. Segments are append-only, so a
+# month that has grown is read on from that offset. A smaller summary of the
+# month's groups (<YYYY-MM>.summary.json) is what a report reads, so earlier
+# months are neither re-read nor re-aggregated. When an invoice was saved
+# more than once, its latest save wins, also when the later save falls in a
+# later month.
+
+
+def _rate(value):
+    return f"{(to_basis_points(value) or 0) / 100:g}"
+
+
+def _chunks(path, offset, rows=chunk_rows):
+    # (end offset, [values]) for up to `rows` complete CSV records at a time
+    # past offset. A record can span lines when an address holds a newline;
+    # a final line without its newline is left for the next run.
+    with open(path, "rb") as f:
+        f.seek(offset)
+        records, pending = [], b""
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            pending += line
+            if pending.count(b'"') % 2:
+                continue  # newline inside a quoted field
+            offset += len(pending)
+            records.append(pending.decode("utf-8"))
+            pending = b""
+            if len(records) >= rows:
+                yield offset, list(csv.reader(records))
+                records = []
+        if records:
+            yield offset, list(csv.reader(records))
+
+
+def _empty_state():
+    return {"version": hsn_cache_version, "size": 0, "end": "", "fieldnames": None, "last_invoice": None, "invoices": {}}
+
+
+def _end_bytes(path, size, length=64):
+    # The last bytes covered by a cached state, to tell an appended segment
+    # from one that was cut back and written again
+    with open(path, "rb") as f:
+        f.seek(max(0, size - length))
+        return f.read(min(size, length)).hex()
+
+
+class HsnReport:
+    def __init__(self, ledger, folder=hsn_cache_folder):
+        self.ledger = ledger
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, month, kind):
+        return os.path.join(self.folder, f"{month}.{kind}.json")
+
+    def _load(self, month, kind):
+        try:
+            with open(self._path(month, kind), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == hsn_cache_version else None
+
+    def _save(self, month, kind, data):
+        tmp_path = self._path(month, kind) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data))  # json.dump encodes in pure Python, several times slower
+        os.replace(tmp_path, self._path(month, kind))
+
+    def _current(self, month, data):
+        # Whether cached data still covers the whole segment
+        path = self.ledger.segment_path(month)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        return data is not None and data["size"] == size and (not size or _end_bytes(path, size) == data["end"])
+
+    def state(self, month):
+        # The month's per-invoice lines, brought up to date with its segment
+        state = self._load(month, "state") or _empty_state()
+        path = self.ledger.segment_path(month)
+        if self._current(month, state):
+            return state
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < state["size"] or state["size"] and _end_bytes(path, state["size"]) != state["end"]:
+            state = _empty_state()  # segment was rewritten
+
+        invoices = state["invoices"]
+        amount_columns = ("Taxable", "CGST Amt", "SGST Amt", "IGST Amt", "Item Total")
+        for offset, records in _chunks(path, state["size"]):
+            if state["fieldnames"] is None:
+                state["fieldnames"] = records.pop(0)
+            fieldnames = state["fieldnames"]
+            for values in records:
+                row = dict(zip(fieldnames, values))
+                if not row.get("Taxable"):
+                    # Rows written before the tax engine carry no per-line tax amounts
+                    row = retax_rows([row])[0]
+                invoice_number, date = row["Invoice No"], row["Date"]
+                entry = invoices.get(invoice_number)
+                if entry is None or invoice_number != state["last_invoice"] or entry["date"] != date:
+                    # First row of a save; a later save replaces the earlier one
+                    entry = invoices[invoice_number] = {"date": date, "gstin": row["GSTIN"].strip(), "lines": {}}
+                state["last_invoice"] = invoice_number
+                amounts = entry["lines"].setdefault(f"{row['HSN'].strip()}\t{_rate(row['Item GST'])}", [0] * 6)
+                amounts[0] += int(float(row["Qty"] or 0))
+                for i, column in enumerate(amount_columns, start=1):
+                    amounts[i] += to_paise(row.get(column) or 0)
+            state["size"] = offset
+        state["end"] = _end_bytes(path, state["size"]) if state["size"] else ""
+        self._save(month, "state", state)
+        return state
+
+    def summary(self, month):
+        # The month's groups and the date of each invoice's save, without
+        # the per-invoice lines; all a report reads for a finished month
+        summary = self._load(month, "summary")
+        if self._current(month, summary):
+            return summary
+        state = self.state(month)
+        groups = defaultdict(lambda: [0] * 6)
+        for entry in state["invoices"].values():
+            _count(groups, "", entry, 1)
+        summary = {"version": hsn_cache_version, "size": state["size"], "end": state["end"],
+                   "groups": {"\t".join(key[1:]): totals for key, totals in groups.items()},
+                   "dates": {invoice_number: entry["date"] for invoice_number, entry in state["invoices"].items()}}
+        self._save(month, "summary", summary)
+        return summary
+
+    def groups(self, first_month=None, last_month=None):
+        # {(month, hsn, rate, gstin): [qty, taxable, cgst, sgst, igst, total]}
+        # in paise. Months after last_month are still read for later saves
+        # of the invoices in range.
+        months = [m for m in self.ledger.months() if first_month is None or m >= first_month]
+        groups = defaultdict(lambda: [0] * 6)
+        latest = {}  # invoice -> (month, date) of the save counted so far
+
+        def uncount(month, invoice_number):
+            if last_month is None or month <= last_month:
+                _count(groups, month, self.state(month)["invoices"][invoice_number], -1)
+
+        for month in months:
+            summary = self.summary(month)
+            if last_month is None or month <= last_month:
+                for key, totals in summary["groups"].items():
+                    groups[(month, *key.split("\t"))] = totals
+            for invoice_number, date in summary["dates"].items():
+                counted = latest.get(invoice_number)
+                if counted is None:
+                    latest[invoice_number] = (month, date)
+                elif counted[1] > date:
+                    uncount(month, invoice_number)
+                else:
+                    uncount(counted[0], invoice_number)
+                    latest[invoice_number] = (month, date)
+        return {key: totals for key, totals in groups.items() if any(totals)}
+
+    def rows(self, first_month=None, last_month=None):
+        # Detail rows (month, HSN, rate, GSTIN) and the HSN/rate summary for
+        # the whole period, amounts in rupees
+        detail, summary = [], defaultdict(lambda: [0] * 6)
+        for (month, hsn, rate, gstin), totals in sorted(self.groups(first_month, last_month).items()):
+            detail.append(_row({"Month": month, "HSN": hsn, "GST %": float(rate), "GSTIN": gstin or unregistered}, totals))
+            period = summary[(hsn, rate)]
+            for i, amount in enumerate(totals):
+                period[i] += amount
+        summary = [_row({"HSN": hsn, "GST %": float(rate)}, totals) for (hsn, rate), totals in sorted(summary.items())]
+        return summary, detail
+
+
+def _count(groups, month, entry, sign):
+    for key, amounts in entry["lines"].items():
+        hsn, rate = key.split("\t")
+        totals = groups[(month, hsn, rate, entry["gstin"])]
+        for i, amount in enumerate(amounts):
+            totals[i] += sign * amount
+
+
+def _row(row, totals):
+    row["Qty"] = totals[0]
+    for name, paise in zip(("Taxable Value", "CGST", "SGST", "IGST", "Total"), totals[1:]):
+        row[name] = from_paise(paise)
+    return row
+
+
+def report_path(first_month, last_month, folder=reports_folder):
+    period = "_".join(m for m in (first_month, last_month) if m) or "all"
+    return os.path.join(folder, f"HSN_Summary_{period}.xlsx")
+
+
+def export_hsn_summary(ledger, first_month=None, last_month=None, path=None):
+    # Excel workbook with the period summary and the monthly detail; a .csv
+    # path gets just the detail, without needing pandas
+    summary, detail = HsnReport(ledger).rows(first_month, last_month)
+    path = path or report_path(first_month, last_month)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["Month", "HSN", "GST %", "GSTIN", "Qty", "Taxable Value",
+                                                   "CGST", "SGST", "IGST", "Total"])
+            writer.writeheader()
+            writer.writerows(detail)
+        return path
+    import pandas as pd
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(summary, columns=["HSN", "GST %", "Qty", "Taxable Value", "CGST", "SGST", "IGST", "Total"]) \
+            .to_excel(writer, sheet_name="HSN Summary", index=False)
+        pd.DataFrame(detail, columns=["Month", "HSN", "GST %", "GSTIN", "Qty", "Taxable Value", "CGST", "SGST", "IGST", "Total"]) \
+            .to_excel(writer, sheet_name="By Month and GSTIN", index=False)
+    return path
+
+
+def parse_month(value):
+    # "YYYY-MM", or ValueError
+    return datetime.strptime(value.strip(), "%Y-%m").strftime("%Y-%m")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bill_prototype.py gst-report",
+                                     description="HSN-wise GST summary of the transactions ledger.")
+    parser.add_argument("--from", dest="first_month", type=parse_month, default=None, help="first month, YYYY-MM")
+    parser.add_argument("--to", dest="last_month", type=parse_month, default=None, help="last month, YYYY-MM")
+    parser.add_argument("--output", default=None, help="workbook (.xlsx) or CSV (.csv) to write")
+    args = parser.parse_args(argv)
+
+    path = export_hsn_summary(TransactionLedger(), args.first_month, args.last_month, args.output)
+    print(f"HSN summary written to {path}")
+    return 0
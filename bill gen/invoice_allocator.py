@@ -0,0 +1,196 @@
+import json
+import os
+import socket
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from billing_core import format_invoice_number, parse_invoice_number
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+invoice_counter_file = "invoice_counter.json"
+invoice_lock_file = "invoice_counter.lock"
+invoice_audit_file = "invoice_audit.jsonl"
+
+# Invoice numbers are handed out in leased blocks. Taking a block locks the
+# counter file, bumps "next" past the block and logs the lease; numbers are
+# then issued from memory until the block runs out. Numbers that were leased
+# but never saved on a bill show up in audit_gaps() for GST reconciliation.
+
+
+@contextmanager
+def file_lock(path=invoice_lock_file, wait=True):
+    # Exclusive lock on `path`; with wait=False, OSError if another process
+    # holds it
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not wait:
+                        raise
+                    time.sleep(0.05)  # LK_LOCK gives up after ~10s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def default_terminal_id():
+    return os.environ.get("BILL_TERMINAL_ID") or socket.gethostname()
+
+
+def _append_audit(entry, path=invoice_audit_file):
+    entry = dict(entry, time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class InvoiceAllocator:
+    def __init__(self, terminal_id=None, block_size=10, counter_path=invoice_counter_file,
+                 lock_path=invoice_lock_file, audit_path=invoice_audit_file, is_used=None):
+        self.terminal_id = terminal_id or default_terminal_id()
+        self.block_size = max(1, int(block_size))
+        self.counter_path = counter_path
+        self.lock_path = lock_path
+        self.audit_path = audit_path
+        # Only consulted when upgrading an old {"counter": n} file, where n was
+        # the number on screen and may already be on a saved bill
+        self.is_used = is_used
+        self._available = deque()
+
+    def _read_next(self):
+        try:
+            with open(self.counter_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if "next" in data:
+            return int(data["next"])
+        counter = int(data.get("counter", 1))
+        if self.is_used is not None and self.is_used(format_invoice_number(counter)):
+            counter += 1
+        return counter
+
+    def _write_next(self, value):
+        tmp_path = self.counter_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next": value}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.counter_path)
+
+    def lease(self, count=None):
+        # Reserve `count` consecutive numbers for this terminal
+        count = count or self.block_size
+        with file_lock(self.lock_path):
+            start = self._read_next()
+            self._write_next(start + count)
+            _append_audit({"event": "lease", "terminal": self.terminal_id, "start": start, "end": start + count - 1},
+                          self.audit_path)
+        self._available.extend(range(start, start + count))
+        return start, start + count - 1
+
+    def next_number(self):
+        if not self._available:
+            self.lease()
+        return self._available.popleft()
+
+    def next_invoice_number(self):
+        return format_invoice_number(self.next_number())
+
+    def advance_past(self, number):
+        # Make sure the counter is beyond a number already on a saved bill,
+        # e.g. one recovered from the write-ahead log after the counter file
+        # was lost or restored from an old copy
+        with file_lock(self.lock_path):
+            if self._read_next() > number:
+                return False
+            self._write_next(number + 1)
+            _append_audit({"event": "advance", "terminal": self.terminal_id, "next": number + 1}, self.audit_path)
+        return True
+
+    def advance_past_bills(self, bills):
+        # advance_past the highest number on `bills` (e.g. those replayed
+        # from the write-ahead log), skipping numbers not in our format
+        numbers = []
+        for bill in bills:
+            try:
+                numbers.append(parse_invoice_number(bill["invoice_number"]))
+            except ValueError:
+                pass
+        return self.advance_past(max(numbers)) if numbers else False
+
+    def return_number(self, number):
+        # Put back a number that was issued but not used, e.g. the one on
+        # screen when the app closes, so release() accounts for it
+        self._available.appendleft(number)
+
+    def remaining(self):
+        return list(self._available)
+
+    def release(self, reason="released"):
+        # Numbers still in hand cannot go back to the shared counter (other
+        # terminals may have moved past them), so record them as unused.
+        if not self._available:
+            return []
+        unused = list(self._available)
+        self._available.clear()
+        _append_audit({"event": "unused", "terminal": self.terminal_id, "numbers": unused, "reason": reason},
+                      self.audit_path)
+        return unused
+
+
+def _read_audit(audit_path):
+    # {number: terminal} for every leased number, and the set released unused
+    leased, released = {}, set()
+    if os.path.exists(audit_path):
+        with open(audit_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("event") == "lease":
+                    for n in range(entry["start"], entry["end"] + 1):
+                        leased[n] = entry["terminal"]
+                elif entry.get("event") == "unused":
+                    released.update(entry["numbers"])
+    return leased, released
+
+
+def live_leases(audit_path=invoice_audit_file):
+    # Numbers leased to a terminal and not released as unused; saved ones
+    # stay live so the bill can be saved again
+    leased, released = _read_audit(audit_path)
+    return set(leased).difference(released)
+
+
+def audit_gaps(bill_store, audit_path=invoice_audit_file):
+    # Every leased number that never made it onto a saved bill, with the
+    # terminal that leased it and whether it was explicitly released.
+    leased, released = _read_audit(audit_path)
+    gaps = []
+    for n in sorted(leased):
+        invoice_number = format_invoice_number(n)
+        if invoice_number not in bill_store:
+            gaps.append({"invoice_number": invoice_number, "terminal": leased[n], "released": n in released})
+    return gaps
@@ -0,0 +1,162 @@
+import csv
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+
+from search_index import NameIndex, normalize
+
+items_file = "items.json"
+recent_item_count = 50
+price_list_columns = ["item", "hsn", "rate", "gst"]
+
+# Item catalog built from the transactions ledger: one entry per item name
+# with its HSN, GST% and the rate it was last sold at. Imported price lists
+# are kept alongside and win over older sales. A snapshot is saved in
+# items.json with the ledger size it was built from, and rebuilt from the
+# ledger when the ledger has grown behind its back.
+#
+# Recently used items are kept in a small LRU and listed first.
+
+
+def ledger_size(ledger):
+    return sum(os.path.getsize(ledger.segment_path(month)) for month in ledger.months())
+
+
+class ItemCatalog:
+    def __init__(self, path=items_file, recent_size=recent_item_count):
+        self.path = path
+        self.items = {}
+        self.price_list = {}
+        self.recent = OrderedDict()
+        self.recent_size = recent_size
+        self.index = NameIndex("hsn")
+        self.ledger_size = 0
+
+    def _merge(self, name, hsn, rate, gst, date, sold=1):
+        name = str(name).strip()
+        key = normalize(name)
+        if not key:
+            return None
+        previous = self.items.get(key)
+        item = dict(previous) if previous else {"name": name, "hsn": "", "rate": "", "gst": "", "last_date": "", "sold": 0}
+        item["sold"] += sold
+        if date >= item["last_date"]:
+            item.update(name=name, hsn=str(hsn).strip(), rate=str(rate).strip(), gst=str(gst).strip(), last_date=date)
+        self.items[key] = item
+        return key, previous, item
+
+    def _update(self, *args, **kwargs):
+        merged = self._merge(*args, **kwargs)
+        if merged is not None:
+            self.index.replace(*merged)
+
+    def build(self, ledger):
+        self.items = {}
+        for row in ledger.iter_rows():
+            self._merge(row["Item"], row["HSN"], row["Rate"], row["Item GST"], str(row["Date"]))
+        for entry in self.price_list.values():
+            self._merge(entry["name"], entry["hsn"], entry["rate"], entry["gst"], entry["date"], sold=0)
+        self.ledger_size = ledger_size(ledger)
+        self.index.bulk_load(self.items)
+        return self
+
+    def load(self, ledger):
+        # The price list and recent items always come from the file; the
+        # catalog only if the ledger has not grown since it was saved
+        data = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self.price_list = data.get("price_list", {})
+        self.recent = OrderedDict.fromkeys(data.get("recent", []))
+        if "items" in data and data.get("ledger_size") == ledger_size(ledger):
+            self.items = data["items"]
+            self.ledger_size = data["ledger_size"]
+            self.index.bulk_load(self.items)
+        else:
+            self.build(ledger)
+            self.save()
+        return self
+
+    def save(self, ledger=None):
+        # Pass the ledger once the bills added since load() are on disk
+        if ledger is not None:
+            self.ledger_size = ledger_size(ledger)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ledger_size": self.ledger_size, "items": self.items,
+                       "price_list": self.price_list, "recent": list(self.recent)}, f)
+        os.replace(tmp_path, self.path)
+
+    def add_bill(self, bill_data):
+        date = str(bill_data.get("date", ""))
+        for item in bill_data.get("items", []):
+            self._update(item["name"], item["hsn"], item["rate"], item["gst"], date)
+
+    def use(self, name):
+        # Mark an item as just used (LRU, most recent last)
+        key = normalize(name)
+        if key not in self.items:
+            return
+        self.recent.pop(key, None)
+        self.recent[key] = None
+        while len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+
+    def import_price_list(self, path):
+        # CSV with item,hsn,rate,gst columns. Returns (imported, skipped rows)
+        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        imported, skipped = 0, []
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [normalize(name) for name in reader.fieldnames or []]
+            missing = [c for c in price_list_columns if c not in reader.fieldnames]
+            if missing:
+                raise ValueError(f"Price list is missing column(s): {', '.join(missing)}")
+            for line, row in enumerate(reader, start=2):
+                try:
+                    name = row["item"].strip()
+                    rate, gst = float(row["rate"]), float(row["gst"])
+                    if not name or rate < 0 or gst < 0:
+                        raise ValueError
+                except (AttributeError, TypeError, ValueError):
+                    skipped.append(line)
+                    continue
+                entry = {"name": name, "hsn": (row["hsn"] or "").strip(), "rate": row["rate"].strip(),
+                         "gst": row["gst"].strip(), "date": date}
+                self.price_list[normalize(name)] = entry
+                self._update(entry["name"], entry["hsn"], entry["rate"], entry["gst"], date, sold=0)
+                imported += 1
+        self.save()
+        return imported, skipped
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, name):
+        return self.items.get(normalize(name))
+
+    def _rank(self, keys, prefix):
+        recent = {key: i for i, key in enumerate(reversed(self.recent))}
+        never = len(recent)
+        items = ((key, self.items[key]) for key in keys)
+        ranked = sorted(items, key=lambda kv: (recent.get(kv[0], never),
+                                               not kv[0].startswith(prefix), -kv[1]["sold"], kv[0]))
+        return [item for _, item in ranked]
+
+    def match(self, text, limit=10, scan=500):
+        # Items whose name (or a word of it) starts with text: recently used
+        # first, then best sellers
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        return self._rank(self.index.names.prefix(prefix, scan), prefix)[:limit]
+
+    def match_hsn(self, text, limit=10, scan=500):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        return self._rank(self.index.codes.prefix(prefix, scan), "")[:limit]
@@ -0,0 +1,196 @@
+import argparse
+import csv
+import os
+
+from tax import retax_rows
+
+ledger_folder = "ledger"
+transactions_file = "transactions.xlsx"  # Excel export, rebuilt on demand
+
+transaction_columns = [
+    "Invoice No", "Date", "Customer", "GSTIN", "Address",
+    "Item", "HSN", "Qty", "Rate", "Item GST", "Taxable",
+    "CGST Amt", "SGST Amt", "IGST Amt", "Item Total",
+    "CGST", "SGST", "Bill Total", "IGST"
+]
+
+
+def transaction_rows(bill_data):
+    # One ledger row per line item, carrying the bill-level fields
+    rows = []
+    for item in bill_data['items']:
+        rows.append({
+            "Invoice No": bill_data['invoice_number'],
+            "Date": bill_data['date'],
+            "Customer": bill_data['customer'],
+            "GSTIN": bill_data['gst'],
+            "Address": bill_data['address'],
+            "Item": item['name'],
+            "HSN": item['hsn'],
+            "Qty": item['qty'],
+            "Rate": item['rate'],
+            "Item GST": item['gst'],
+            "Taxable": item.get('taxable', ""),
+            "CGST Amt": item.get('cgst_amount', ""),
+            "SGST Amt": item.get('sgst_amount', ""),
+            "IGST Amt": item.get('igst_amount', ""),
+            "Item Total": item['total'],
+            "CGST": bill_data['cgst'],
+            "SGST": bill_data['sgst'],
+            "Bill Total": bill_data['total'],
+            "IGST": "Yes" if bill_data.get('igst') else "No",
+        })
+    return rows
+
+
+class TransactionLedger:
+    # Line-item ledger stored as monthly CSV segments (ledger/2025-04.csv).
+    # Saving a bill appends its rows to the current segment; nothing already
+    # written is read back.
+
+    def __init__(self, folder=ledger_folder):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+        self._segment_month = None
+        self._segment_file = None
+        self._writer = None
+        # Segments closed since the last sync(), still to be fsynced
+        self._unsynced = set()
+
+    def segment_path(self, month):
+        return os.path.join(self.folder, f"{month}.csv")
+
+    def months(self):
+        return sorted(name[:-4] for name in os.listdir(self.folder) if name.endswith(".csv"))
+
+    def _open_segment(self, month):
+        if month == self._segment_month:
+            return self._writer
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._unsynced.add(self._segment_file.name)
+        path = self.segment_path(month)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        fieldnames = transaction_columns
+        if not is_new:
+            # Keep appending in the segment's own column layout
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                fieldnames = next(csv.reader(f))
+        self._segment_file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._segment_file, fieldnames=fieldnames, extrasaction="ignore")
+        if is_new:
+            self._writer.writeheader()
+        self._segment_month = month
+        return self._writer
+
+    def append_rows(self, rows):
+        for row in rows:
+            self._open_segment(str(row["Date"])[:7]).writerow(row)
+        if self._segment_file is not None:
+            self._segment_file.flush()
+
+    def append_bill(self, bill_data):
+        self.append_rows(transaction_rows(bill_data))
+
+    def iter_rows(self, months=None):
+        for month in months or self.months():
+            path = self.segment_path(month)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                yield from csv.DictReader(f)
+
+    def last_modified(self):
+        mtimes = [os.path.getmtime(self.segment_path(m)) for m in self.months()]
+        return max(mtimes, default=0)
+
+    def export_xlsx(self, path=transactions_file, force=False):
+        # Build the Excel workbook from the segments, skipping the work when
+        # the existing export is already newer than every segment.
+        if not force and os.path.exists(path) and os.path.getmtime(path) >= self.last_modified():
+            return path
+        import pandas as pd
+        frames = [pd.read_csv(self.segment_path(m), dtype=str, keep_default_na=False) for m in self.months()]
+        frames = [f for f in frames if not f.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=transaction_columns)
+        df.to_excel(path, index=False)
+        return path
+
+    def sync(self):
+        for path in self._unsynced:
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+        self._unsynced.clear()
+        if self._segment_file is not None:
+            self._segment_file.flush()
+            os.fsync(self._segment_file.fileno())
+
+    def durable_files(self):
+        return [self.segment_path(month) for month in self.months()]
+
+    def close(self):
+        if self._segment_file is not None:
+            self._segment_file.close()
+        self._segment_month = None
+        self._segment_file = None
+        self._writer = None
+
+
+ledger_retaxed_folder = "ledger_retaxed"
+
+
+def retax_ledger(ledger, rate_overrides=None, output_folder=ledger_retaxed_folder):
+    # Recompute every line of the ledger with the tax engine, one monthly
+    # segment at a time, writing the results to a separate set of segments.
+    #
+    #   python bill_prototype.py retax --rate 8431=12 --rate 4009=18
+    os.makedirs(output_folder, exist_ok=True)
+    count = 0
+    for month in ledger.months():
+        rows = retax_rows(ledger.iter_rows([month]), rate_overrides)
+        with open(os.path.join(output_folder, f"{month}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=transaction_columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def parse_rate_override(value):
+    # "HSN=GST%", e.g. "8431=12", or ValueError
+    hsn, sep, rate = value.partition("=")
+    if not sep or not hsn.strip():
+        raise ValueError(f"expected HSN=GST, got {value!r}")
+    float(rate)
+    return hsn.strip(), rate.strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bill_prototype.py retax",
+                                     description="Recompute the ledger's tax amounts, e.g. after a GST rate change.")
+    parser.add_argument("--rate", dest="rates", action="append", default=[], type=parse_rate_override,
+                        metavar="HSN=GST", help="new GST %% for an HSN code; may be repeated")
+    parser.add_argument("--output", default=ledger_retaxed_folder, help="folder for the recomputed segments")
+    args = parser.parse_args(argv)
+
+    count = retax_ledger(TransactionLedger(), dict(args.rates), args.output)
+    print(f"Recomputed {count} ledger rows into {args.output}/")
+    return 0
+
+
+def migrate_legacy_transactions(ledger, path=transactions_file):
+    # One-time import of rows from an old transactions.xlsx that was used as
+    # storage. After import the workbook is only ever an export.
+    marker = os.path.join(ledger.folder, ".imported_xlsx")
+    if os.path.exists(marker) or not os.path.exists(path) or ledger.months():
+        return 0
+    import pandas as pd
+    try:
+        df = pd.read_excel(path, dtype=str).fillna("")
+    except Exception:
+        return 0
+    rows = df.to_dict("records")
+    ledger.append_rows(rows)
+    ledger.sync()
+    open(marker, "w").close()
+    return len(rows)
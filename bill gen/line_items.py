@@ -0,0 +1,145 @@
+import csv
+import io
+
+from tax import from_paise, line_tax, line_taxable, to_basis_points
+
+# Line items of the bill being entered. Each line is a slotted record holding
+# its amounts in paise; the container keeps running sums, so adding, removing
+# or previewing a bill with thousands of lines never re-sums the list. The
+# sums depend on the bill's CGST/SGST split and IGST flag, so changing those
+# retaxes every line once (set_taxes).
+
+
+class LineItem:
+    __slots__ = ("name", "hsn", "qty", "rate", "gst", "gst_bp",
+                 "taxable", "cgst", "sgst", "igst", "total")
+
+    def __init__(self, name, hsn, qty, rate, gst):
+        # Raises ValueError for non-numeric quantity, rate or GST, as make_item
+        self.name = name
+        self.hsn = hsn
+        self.qty = int(qty)
+        self.rate = float(rate)
+        self.gst = float(gst)
+        self.gst_bp = to_basis_points(self.gst) or 0
+        self.taxable = line_taxable(self.qty, self.rate)
+
+    def apply_taxes(self, cgst_bp, sgst_bp, igst):
+        self.cgst, self.sgst, self.igst = line_tax(self.taxable, self.gst_bp, cgst_bp, sgst_bp, igst)
+        self.total = self.taxable + self.cgst + self.sgst + self.igst
+
+    def as_dict(self):
+        # The item dict stored on a bill (same fields as make_item)
+        return {
+            "name": self.name, "hsn": self.hsn, "qty": self.qty, "rate": self.rate, "gst": self.gst,
+            "taxable": from_paise(self.taxable),
+            "cgst_amount": from_paise(self.cgst),
+            "sgst_amount": from_paise(self.sgst),
+            "igst_amount": from_paise(self.igst),
+            "total": from_paise(self.total),
+        }
+
+
+class LineItems:
+    def __init__(self, cgst="", sgst="", igst=False):
+        self.lines = []
+        self.cgst_bp = to_basis_points(cgst)
+        self.sgst_bp = to_basis_points(sgst)
+        self.igst = bool(igst)
+        self._zero_sums()
+
+    def _zero_sums(self):
+        self.subtotal = self.cgst = self.sgst = self.igst_total = self.total = 0
+
+    def _count(self, line, sign):
+        self.subtotal += sign * line.taxable
+        self.cgst += sign * line.cgst
+        self.sgst += sign * line.sgst
+        self.igst_total += sign * line.igst
+        self.total += sign * line.total
+
+    def set_taxes(self, cgst="", sgst="", igst=False):
+        # Raises ValueError for an invalid CGST/SGST rate; retaxes only when
+        # the split or IGST flag actually changed
+        mode = (to_basis_points(cgst), to_basis_points(sgst), bool(igst))
+        if mode == (self.cgst_bp, self.sgst_bp, self.igst):
+            return False
+        self.cgst_bp, self.sgst_bp, self.igst = mode
+        self._zero_sums()
+        for line in self.lines:
+            line.apply_taxes(*mode)
+            self._count(line, 1)
+        return True
+
+    def add(self, name, hsn, qty, rate, gst):
+        line = LineItem(name, hsn, qty, rate, gst)
+        line.apply_taxes(self.cgst_bp, self.sgst_bp, self.igst)
+        self.lines.append(line)
+        self._count(line, 1)
+        return line
+
+    def remove(self, index):
+        line = self.lines.pop(index)
+        self._count(line, -1)
+        return line
+
+    def clear(self):
+        self.lines = []
+        self._zero_sums()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def totals(self):
+        # Bill-level sums in rupees, as compute_bill_taxes returns them
+        return {
+            "subtotal": from_paise(self.subtotal),
+            "cgst_amount": from_paise(self.cgst),
+            "sgst_amount": from_paise(self.sgst),
+            "igst_amount": from_paise(self.igst_total),
+            "total": from_paise(self.total),
+        }
+
+    def as_dicts(self):
+        return [line.as_dict() for line in self.lines]
+
+
+def parse_pasted_lines(text, lookup=None):
+    # Rows copied from a spreadsheet (tab separated) or a CSV file:
+    #   name, hsn, qty, rate, gst    or    name, qty
+    # The short form takes HSN, rate and GST% from lookup(name) (the item
+    # catalog). A header row is skipped. Returns ([(name, hsn, qty, rate,
+    # gst)], [(line number, reason)]).
+    dialect = "excel-tab" if "\t" in text else "excel"
+    rows, errors = [], []
+    for line_no, row in enumerate(csv.reader(io.StringIO(text), dialect=dialect), start=1):
+        row = [cell.strip() for cell in row]
+        if not any(row):
+            continue
+        if line_no == 1 and len(row) >= 2 and not row[1 if len(row) == 2 else 2].isdigit():
+            continue  # header
+        if len(row) >= 5:
+            name, hsn, qty, rate, gst = row[:5]
+        elif len(row) == 2:
+            name, qty = row
+            item = lookup(name) if lookup is not None else None
+            if item is None:
+                errors.append((line_no, f"unknown item {name!r}"))
+                continue
+            name, hsn, rate, gst = item["name"], item["hsn"], item["rate"], item["gst"]
+        else:
+            errors.append((line_no, "expected name, hsn, qty, rate, gst or name, qty"))
+            continue
+        try:
+            int(qty), float(rate), float(gst)
+        except ValueError:
+            errors.append((line_no, "invalid quantity, rate or GST"))
+            continue
+        rows.append((name, hsn, qty, rate, gst))
+    return rows, errors
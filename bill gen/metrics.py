@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from logging.handlers import MemoryHandler, RotatingFileHandler
+
+# Timing spans and file-size gauges for the hot paths.
+#
+#   with metrics.span("ledger.append"):
+#       ...
+#
+# Every span is written as one JSON line to metrics.log (rotated at 1 MB,
+# three backups kept) and its latency kept in memory for the Performance
+# panel. BILL_METRICS=0 turns it all off: span() then hands back one shared
+# do-nothing context manager. BILL_PROFILE=<span name> (or profile_next())
+# runs the next occurrence of that span under cProfile and writes the stats
+# to profiles/.
+
+metrics_log_file = "metrics.log"
+profiles_folder = "profiles"
+recent_samples = 200
+gauge_interval = 30  # seconds between file-size gauge records
+
+enabled = os.environ.get("BILL_METRICS", "1") != "0"
+
+_null_span = nullcontext()
+_lock = threading.Lock()
+_recent = defaultdict(lambda: deque(maxlen=recent_samples))
+_counts = defaultdict(int)
+_gauges = {}
+_last_gauges = 0.0
+_logger = None
+_profile_next = os.environ.get("BILL_PROFILE") or None
+last_profile = None
+
+
+def _log():
+    global _logger
+    if _logger is None:
+        _logger = logging.getLogger("billing.metrics")
+        _logger.propagate = False
+        _logger.setLevel(logging.INFO)
+        handler = RotatingFileHandler(metrics_log_file, maxBytes=1024 * 1024, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        # Written out 200 records at a time (and at exit), not per span
+        _logger.addHandler(MemoryHandler(200, flushLevel=logging.ERROR, target=handler))
+    return _logger
+
+
+def _write(entry):
+    entry["time"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    _log().info(json.dumps(entry))
+
+
+def record(name, ms):
+    # A timing measured elsewhere (e.g. startup milestones)
+    if not enabled:
+        return
+    with _lock:
+        _recent[name].append(ms)
+        _counts[name] += 1
+    _write({"kind": "span", "name": name, "ms": round(ms, 3)})
+
+
+def span(name):
+    if not enabled:
+        return _null_span
+    if _profile_next == name:
+        return _profiled_span(name)
+    return _span(name)
+
+
+@contextmanager
+def _span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def _profiled_span(name):
+    global _profile_next, last_profile
+    import cProfile
+    import pstats
+
+    _profile_next = None
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        record(name, (time.perf_counter() - started) * 1000)
+        os.makedirs(profiles_folder, exist_ok=True)
+        path = os.path.join(profiles_folder, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        with open(path[:-5] + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        last_profile = path
+        _write({"kind": "profile", "name": name, "path": path})
+
+
+def profile_next(name):
+    # Capture a cProfile of the next `name` span (on whichever thread runs it)
+    global _profile_next
+    _profile_next = name
+
+
+def profile_pending():
+    return _profile_next
+
+
+def gauge(name, value):
+    if not enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+    _write({"kind": "gauge", "name": name, "value": value})
+
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(_path_size(os.path.join(path, name)) for name in os.listdir(path))
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def record_file_gauges(paths, force=False):
+    # Sizes in bytes of the data files; at most every gauge_interval seconds
+    # unless forced. Missing files are skipped.
+    global _last_gauges
+    if not enabled:
+        return
+    now = time.monotonic()
+    if not force and now - _last_gauges < gauge_interval:
+        return
+    _last_gauges = now
+    for path in paths:
+        size = _path_size(path)
+        if size is not None:
+            gauge(f"size:{path}", size)
+
+
+def snapshot():
+    # {name: {"count", "last", "p50", "p99", "max"}} over recent samples (ms),
+    # plus the latest gauges
+    with _lock:
+        recent = {name: list(samples) for name, samples in _recent.items()}
+        counts = dict(_counts)
+        gauges = dict(_gauges)
+    spans = {}
+    for name, samples in recent.items():
+        ordered = sorted(samples)
+        spans[name] = {
+            "count": counts[name],
+            "last": samples[-1],
+            "p50": ordered[len(ordered) // 2],
+            "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            "max": ordered[-1],
+        }
+    return spans, gauges
@@ -0,0 +1,262 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from bill_store import migrate_bill_log, migrate_legacy_bills, open_bill_store
+from ledger import TransactionLedger, migrate_legacy_transactions
+from rollups import MonthlyRollups
+from wal import WriteAheadLog
+
+# Write-behind persistence for saved bills. The Tk thread only enqueues the
+# bill; a single worker thread appends it to the bill store and ledger.
+# Whatever has queued up while a write was in progress is written as one
+# group with a single fsync per file. Results come back through a second
+# queue that the UI drains from its own thread (Tk must not be touched from
+# the worker).
+#
+# With a write-ahead log the group is first logged and fsynced there (the
+# commit), then applied to the bill store, ledger and rollups, which are only
+# fsynced when a checkpoint is taken: every checkpoint_every groups or
+# checkpoint_interval seconds, and when the worker stops. A group therefore
+# costs one fsync.
+
+checkpoint_groups = 64  # default checkpoint_every
+
+_stop = object()
+
+
+def apply_bill(bill_store, ledger, rollups, bill_data, lsn=None, replay=False):
+    previous = None
+    if rollups is not None and bill_data["invoice_number"] in bill_store:
+        previous = bill_store.get(bill_data["invoice_number"])
+    with metrics.span("bill_store.append"):
+        bill_store.append(bill_data)
+    with metrics.span("ledger.append"):
+        ledger.append_bill(bill_data)
+    if rollups is not None:
+        with metrics.span("rollups.add"):
+            rollups.add_bill(bill_data, previous, lsn, replay)
+
+
+def view_files(bill_store, ledger):
+    # (files, folders) for WriteAheadLog.checkpoint()
+    return bill_store.durable_files() + ledger.durable_files(), {ledger.folder: ".csv", **bill_store.durable_folders()}
+
+
+def checkpoint_views(wal, bill_store, ledger):
+    # The views go to disk first; the checkpoint then vouches for them
+    bill_store.sync()
+    ledger.sync()
+    wal.checkpoint(*view_files(bill_store, ledger))
+
+
+def open_views(wal=None):
+    # The bill store, ledger and rollups as of the last bill committed to
+    # the write-ahead log: the files are cut back to the last checkpoint and
+    # the log tail is replayed on top, then the old bills.json and
+    # transactions.xlsx are imported on first run and finished months of a
+    # partitioned bill store are sealed. Returns
+    # (wal, bill_store, ledger, rollups, replayed bills).
+    wal = wal or WriteAheadLog()
+    wal.restore_files()
+    bill_store = open_bill_store()
+    ledger = TransactionLedger()
+    rollups = MonthlyRollups()
+    replayed = []
+    with metrics.span("wal.replay"):
+        for lsn, record in wal.tail():
+            apply_bill(bill_store, ledger, rollups, record["bill"], lsn, replay=True)
+            replayed.append(record["bill"])
+    migrate_legacy_bills(bill_store)
+    migrate_bill_log(bill_store)
+    migrate_legacy_transactions(ledger)
+    with metrics.span("bill_store.seal"):
+        bill_store.seal_closed()
+    rollups.save()
+    checkpoint_views(wal, bill_store, ledger)
+    return wal, bill_store, ledger, rollups, replayed
+
+
+class PersistenceWorker:
+    def __init__(self, bill_store, ledger, rollups=None, max_batch=64, retries=3, on_result=None,
+                 wal=None, checkpoint_every=checkpoint_groups, checkpoint_interval=5.0):
+        self.bill_store = bill_store
+        self.ledger = ledger
+        self.rollups = rollups
+        self.wal = wal
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self._unchecked = 0
+        self._last_checkpoint = time.monotonic()
+        # A logged bill the views failed to take: the views are left alone
+        # from then on and no more checkpoints are taken, so the next startup
+        # cuts them back and replays the log
+        self._views_behind = False
+        # lsn of the last bill in the views (e.g. for rebuild_all)
+        self.applied_lsn = wal.lsn if wal is not None else None
+        # Called on the worker thread with (bill, error) instead of queueing
+        # the result for completed(), for callers that are not a Tk window
+        self.on_result = on_result
+        self.max_batch = max_batch
+        self.retries = retries
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Held while a group is written; see paused()
+        self._writing = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="bill-persistence", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def submit(self, bill_data):
+        with self._lock:
+            self._pending += 1
+        self.jobs.put(bill_data)
+
+    def _log(self, group):
+        # Commit the group: one fsync of the write-ahead log. A failed commit
+        # is taken back out of the log before it is retried.
+        position = self.wal.position()
+        try:
+            with metrics.span("wal.commit"):
+                lsns = [self.wal.append({"bill": bill_data}) for bill_data in group]
+                self.wal.sync()
+        except Exception:
+            self.wal.rollback(*position)
+            raise
+        return lsns
+
+    def _apply_logged(self, group, lsns):
+        # The group is committed; the views take it once, without retries. A
+        # retry would apply a half-written bill again: extra ledger rows, and
+        # the rollups subtracting the bill as its own earlier save.
+        if self._views_behind:
+            return
+        try:
+            for bill_data, lsn in zip(group, lsns):
+                self._write(bill_data, lsn)
+                self.applied_lsn = lsn
+            self._sync()
+            self._checkpoint()
+        except Exception:
+            self._views_behind = True
+
+    def _write(self, bill_data, lsn=None):
+        apply_bill(self.bill_store, self.ledger, self.rollups, bill_data, lsn)
+
+    def _sync(self):
+        with metrics.span("persist.sync"):
+            self._sync_files()
+
+    def _sync_files(self):
+        if self.wal is None:
+            self.bill_store.sync()
+            self.ledger.sync()
+        if self.rollups is not None:
+            self.rollups.save()
+
+    def _checkpoint(self, force=False):
+        if self.wal is None or self._views_behind:
+            return
+        if not force:
+            self._unchecked += 1
+            due = time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+            if self._unchecked < self.checkpoint_every and not due:
+                return
+        if self._unchecked:
+            with metrics.span("wal.checkpoint"):
+                checkpoint_views(self.wal, self.bill_store, self.ledger)
+            self._unchecked = 0
+            self._last_checkpoint = time.monotonic()
+
+    def _final_checkpoint(self):
+        try:
+            self._checkpoint(force=True)
+        except OSError:
+            pass  # the next startup replays the log tail instead
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is _stop:
+                self._final_checkpoint()
+                self.jobs.task_done()
+                return
+            group = [job]
+            stop_after = False
+            while len(group) < self.max_batch:
+                try:
+                    job = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _stop:
+                    stop_after = True
+                    break
+                group.append(job)
+
+            # With a log only the commit is retried; a bill is saved once it
+            # is committed. Without one, retries resume from the first bill
+            # that was not fully written.
+            error, written = None, 0
+            with self._writing:
+                for attempt in range(self.retries):
+                    try:
+                        if self.wal is not None:
+                            self._apply_logged(group, self._log(group))
+                        else:
+                            while written < len(group):
+                                self._write(group[written])
+                                written += 1
+                            self._sync()
+                        error = None
+                        break
+                    except Exception as e:
+                        error = e
+                        time.sleep(0.2 * (attempt + 1))
+
+            with self._lock:
+                self._pending -= len(group)
+            for bill_data in group:
+                if self.on_result is not None:
+                    self.on_result(bill_data, error)
+                else:
+                    self.results.put((bill_data, error))
+                self.jobs.task_done()
+            if stop_after:
+                self._final_checkpoint()
+                self.jobs.task_done()
+                return
+
+    def completed(self):
+        # (bill, error) pairs finished since the last call; error is None on
+        # success. Call from the UI thread.
+        done = []
+        while True:
+            try:
+                done.append(self.results.get_nowait())
+            except queue.Empty:
+                return done
+
+    def flush(self):
+        self.jobs.join()
+
+    @contextmanager
+    def paused(self):
+        # Keeps the worker between groups, e.g. while the rollups are rebuilt
+        # from the ledger and swapped in; bills submitted meanwhile wait in
+        # the queue and are written afterwards
+        with self._writing:
+            yield
+
+    def close(self):
+        # Write everything still queued, then stop the worker
+        if self._thread.is_alive():
+            self.jobs.put(_stop)
+            self._thread.join()
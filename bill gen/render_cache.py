@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+
+import metrics
+from renderer import get_renderer
+
+render_cache_folder = "render_cache"
+print_spool_folder = "print_spool"
+render_cache_max_bytes = 64 * 1024 * 1024
+render_cache_version = 1  # bump when the invoice layout changes
+spool_keep = 15 * 60  # seconds a print job stays on disk after it was written
+
+# Rendered invoices, one HTML document per bill, stored under the SHA-256 of
+# the bill's contents and the stylesheet. Opening the same bill again (a
+# preview, then a print, or a saved bill looked up from search) is a hash and
+# a stat; editing the bill changes the key, so nothing is ever stale. The
+# least recently used documents are removed once the folder grows past
+# render_cache_max_bytes.
+#
+# Documents holding several invoices go to print_spool/ as numbered jobs,
+# copied together from the cached invoices. Jobs older than spool_keep are
+# removed as new ones are written and when the app exits, so nothing is left
+# behind in the system temp folder any more.
+
+
+def bill_key(bill_data, stylesheet=""):
+    # pickle rather than JSON: encoding the floats of a long bill as JSON
+    # costs about as much as rendering it. Equal bills built differently may
+    # pickle differently, which only costs a second render.
+    digest = hashlib.sha256(f"{render_cache_version}\n{stylesheet}\n".encode("utf-8"))
+    digest.update(pickle.dumps(bill_data, protocol=4))
+    return digest.hexdigest()
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class RenderCache:
+    def __init__(self, folder=render_cache_folder, max_bytes=render_cache_max_bytes, renderer=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.renderer = renderer or get_renderer()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self.size = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # left by a crash mid-write
+            elif name.endswith(".html"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self.size += size
+
+    def path_for(self, bill_data):
+        # The cached document for bill_data, rendered first if need be
+        name = bill_key(bill_data, self.renderer.stylesheet) + ".html"
+        path = os.path.join(self.folder, name)
+        with self._lock:
+            if name in self._entries and os.path.exists(path):
+                self._entries.move_to_end(name)
+                os.utime(path)  # so the order survives a restart
+                return path
+        with metrics.span("render_html"):
+            html = self.renderer.render(bill_data)
+        _write_atomic(path, html)
+        with self._lock:
+            self.size -= self._entries.pop(name, 0)
+            self._entries[name] = os.path.getsize(path)
+            self.size += self._entries[name]
+            self._evict(keep=name)
+        return path
+
+    def invoice(self, bill_data):
+        # Just the invoice's part of its cached document, to be combined
+        # with others under one stylesheet
+        with open(self.path_for(bill_data), "r", encoding="utf-8") as f:
+            html = f.read()
+        start, end = io.StringIO(), io.StringIO()
+        self.renderer.write_document_start(start, f"Invoice {bill_data['invoice_number']}")
+        self.renderer.write_document_end(end)
+        return html[len(start.getvalue()):len(html) - len(end.getvalue())]
+
+    def _evict(self, keep=None):
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            del self._entries[name]
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass  # open in a browser on Windows; gone from the index anyway
+
+
+class PrintSpool:
+    def __init__(self, cache=None, folder=print_spool_folder, keep=spool_keep):
+        self.cache = cache or RenderCache()
+        self.folder = folder
+        self.keep = keep
+        self._numbers = count(1)
+        os.makedirs(self.folder, exist_ok=True)
+        self.cleanup()
+
+    def open_bill(self, bill_data):
+        # One invoice needs no job of its own: the cached document is opened
+        return self.cache.path_for(bill_data)
+
+    def submit(self, bills, title="Invoices"):
+        # Writes one document for any number of bills (an iterable, so they
+        # can be streamed from the store) and returns its path and the
+        # number of invoices in it
+        self.cleanup()
+        renderer = self.cache.renderer
+        path = os.path.join(self.folder, f"job-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._numbers)}.html")
+        printed = 0
+        with metrics.span("print_spool"):
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                renderer.write_document_start(f, title)
+                for bill_data in bills:
+                    f.write(self.cache.invoice(bill_data))
+                    printed += 1
+                renderer.write_document_end(f)
+            os.replace(path + ".tmp", path)
+        return path, printed
+
+    def cleanup(self, max_age=None):
+        # Remove jobs written more than max_age seconds ago (default: keep)
+        max_age = self.keep if max_age is None else max_age
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) <= cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass  # still open, or removed by another window
+        return removed
@@ -0,0 +1,111 @@
+import io
+from functools import lru_cache
+from html import escape
+from string import Template
+
+# Invoice HTML rendering. The page pieces are compiled once per renderer and
+# written straight to a stream, so a bill with thousands of rows or a print
+# run of hundreds of bills is a sequence of writes rather than ever-growing
+# string concatenation. Several invoices can share one document and one
+# stylesheet, each starting on a new printed page.
+
+default_stylesheet = """
+table, th, td {border: 1px solid black; border-collapse: collapse; padding: 5px;}
+th {background-color: #f2f2f2;}
+.header {text-align: center;}
+.customer-info {margin-bottom: 15px;}
+.invoice + .invoice {page-break-before: always; break-before: page;}
+"""
+
+_document_start = Template("""<html><head><meta charset="utf-8"><title>$title</title><style>$stylesheet</style></head><body>
+""")
+
+_document_end = "</body></html>\n"
+
+_invoice_start = Template("""<div class="invoice">
+<div class="header">
+    <h2>company name</h2>
+    <p>Deals in Crane, Hose Pipes &amp; Fittings<br>GSTIN: gst number | +91-9752499xxx<br>Address: abcd</p>
+</div>
+<hr>
+<div class="customer-info">
+    <p><b>Invoice No:</b> $invoice_number</p>
+    <p><b>Customer:</b> $customer</p>
+    <p><b>GSTIN:</b> $gst</p>
+    <p><b>Address:</b> $address</p>
+    <p><b>Date:</b> $date</p>
+</div>
+<table><tr><th>S. No.</th><th>Item</th><th>HSN</th><th>Qty</th><th>Rate</th><th>GST</th><th>Total</th></tr>
+""")
+
+_row = "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}%</td><td>{:.2f}</td></tr>\n".format
+
+_invoice_end = "<br><b>Total Amount: &#8377;{:.2f}</b><br>\n</div>\n".format
+
+
+def _text(value):
+    return escape(str(value))
+
+
+class InvoiceRenderer:
+    def __init__(self, stylesheet=default_stylesheet):
+        self.stylesheet = stylesheet
+
+    def write_document_start(self, stream, title="Invoice"):
+        stream.write(_document_start.substitute(title=_text(title), stylesheet=self.stylesheet))
+
+    def write_document_end(self, stream):
+        stream.write(_document_end)
+
+    def write_invoice(self, stream, bill_data):
+        write = stream.write
+        write(_invoice_start.substitute(
+            invoice_number=_text(bill_data['invoice_number']),
+            customer=_text(bill_data['customer']),
+            gst=_text(bill_data['gst']),
+            address=_text(bill_data['address']),
+            date=_text(bill_data['date']),
+        ))
+        for idx, item in enumerate(bill_data['items'], start=1):
+            write(_row(idx, _text(item['name']), _text(item['hsn']), item['qty'], item['rate'], item['gst'], item['total']))
+        write("</table><br>")
+        if 'subtotal' in bill_data:
+            write(f"<b>Taxable Value:</b> &#8377;{bill_data['subtotal']:.2f}<br>")
+        if bill_data.get('igst'):
+            write(f"<b>IGST:</b> &#8377;{bill_data['igst_amount']:.2f}<br>")
+        elif 'cgst_amount' in bill_data:
+            write(f"<b>CGST:</b> {_text(bill_data['cgst'])}% &#8377;{bill_data['cgst_amount']:.2f} "
+                  f"<b>SGST:</b> {_text(bill_data['sgst'])}% &#8377;{bill_data['sgst_amount']:.2f}<br>")
+        else:
+            write(f"<b>CGST:</b> {_text(bill_data['cgst'])}% <b>SGST:</b> {_text(bill_data['sgst'])}%<br>")
+        write(_invoice_end(bill_data['total']))
+
+    def render_to(self, stream, bill_data):
+        self.write_document_start(stream, f"Invoice {bill_data['invoice_number']}")
+        self.write_invoice(stream, bill_data)
+        self.write_document_end(stream)
+
+    def render(self, bill_data):
+        buffer = io.StringIO()
+        self.render_to(buffer, bill_data)
+        return buffer.getvalue()
+
+    def render_many_to(self, stream, bills, title="Invoices"):
+        # One print-ready document; `bills` may be any iterable, so callers
+        # can stream bills from the store without holding them all.
+        self.write_document_start(stream, title)
+        count = 0
+        for bill_data in bills:
+            self.write_invoice(stream, bill_data)
+            count += 1
+        self.write_document_end(stream)
+        return count
+
+    def render_many_to_file(self, path, bills, title="Invoices"):
+        with open(path, "w", encoding="utf-8") as f:
+            return self.render_many_to(f, bills, title)
+
+
+@lru_cache(maxsize=None)
+def get_renderer(stylesheet=default_stylesheet):
+    return InvoiceRenderer(stylesheet)
@@ -0,0 +1,78 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Search results list that only materialises what is on screen. A query's
+# full result is a list of invoice numbers; rows are inserted into the
+# Treeview a page at a time as the user scrolls towards the end, so showing
+# half a million matches costs one page of inserts, not half a million.
+
+
+class PagedResultsView(tk.Frame):
+    def __init__(self, master, columns, fetch_rows, on_sort=None, page_size=100):
+        # columns: [(key, heading), ...]; fetch_rows(ids) -> row value tuples
+        super().__init__(master)
+        self.fetch_rows = fetch_rows
+        self.on_sort = on_sort
+        self.page_size = page_size
+        self.ids = []
+        self.loaded = 0
+        self.sort_by = "date"
+        self.descending = True
+
+        self.count_label = tk.Label(self, text="", anchor="w")
+        self.count_label.pack(fill=tk.X)
+
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(body, columns=[key for key, _ in columns], show="headings")
+        self.headings = dict(columns)
+        for key, heading in columns:
+            self.tree.heading(key, text=heading, command=lambda k=key: self.sort(k))
+            self.tree.column(key, width=150)
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.update_headings()
+
+    def show_results(self, ids):
+        self.ids = ids
+        self.loaded = 0
+        self.tree.delete(*self.tree.get_children())
+        self.count_label.config(text=f"{len(ids)} bill(s) found")
+        self.load_next_page()
+
+    def show_message(self, text):
+        self.count_label.config(text=text)
+
+    def load_next_page(self):
+        page = self.ids[self.loaded:self.loaded + self.page_size]
+        if not page:
+            return
+        for invoice, values in zip(page, self.fetch_rows(page)):
+            self.tree.insert("", "end", iid=invoice, values=values)
+        self.loaded += len(page)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Near the bottom of what is loaded: fetch the next page
+        if float(last) > 0.9 and self.loaded < len(self.ids):
+            self.after_idle(self.load_next_page)
+
+    def sort(self, key):
+        if key == self.sort_by:
+            self.descending = not self.descending
+        else:
+            self.sort_by, self.descending = key, key in ("date", "total")
+        self.update_headings()
+        if self.on_sort is not None:
+            self.on_sort(self.sort_by, self.descending)
+
+    def update_headings(self):
+        for key, heading in self.headings.items():
+            if key == self.sort_by:
+                heading += " ▼" if self.descending else " ▲"
+            self.tree.heading(key, text=heading)
+
+    def selected_ids(self):
+        return list(self.tree.selection())
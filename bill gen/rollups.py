@@ -0,0 +1,265 @@
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from ledger import TransactionLedger
+from tax import retax_rows, to_paise
+
+reports_folder = "monthly_reports"
+rollups_folder = os.path.join(reports_folder, "rollups")
+top_customer_count = 10
+
+# Per-month and per-day aggregates (invoice count, subtotal, CGST, SGST,
+# IGST, total, per-customer totals), kept in one small JSON file per month
+# under monthly_reports/rollups/. Saving a bill adjusts its month in place
+# (subtracting the earlier version when an invoice is saved again), so the
+# monthly workbook can be written straight from the rollup.
+#
+# Each month also keeps the write-ahead log sequence number ("lsn") of the
+# last bill applied to it, so replaying the log after a crash skips bills a
+# month file already holds.
+
+_amount_fields = ("subtotal", "cgst", "sgst", "igst", "total")
+
+
+def _empty_totals():
+    return {"invoices": 0, "subtotal": 0, "cgst": 0, "sgst": 0, "igst": 0, "total": 0}
+
+
+def _empty_month():
+    month = _empty_totals()
+    month["days"] = {}
+    month["customers"] = {}
+    return month
+
+
+def bill_amounts(bill_data):
+    # Bill-level amounts in paise; older bills without the tax engine's
+    # fields only have a total
+    return {
+        "subtotal": to_paise(bill_data.get("subtotal", 0)),
+        "cgst": to_paise(bill_data.get("cgst_amount", 0)),
+        "sgst": to_paise(bill_data.get("sgst_amount", 0)),
+        "igst": to_paise(bill_data.get("igst_amount", 0)),
+        "total": to_paise(bill_data.get("total", 0)),
+    }
+
+
+def _month_key(bill_data):
+    return str(bill_data.get("date", ""))[:7]
+
+
+def _apply(month, day, customer, amounts, sign):
+    day_totals = month["days"].setdefault(day, _empty_totals())
+    for totals in (month, day_totals):
+        totals["invoices"] += sign
+        for field in _amount_fields:
+            totals[field] += sign * amounts[field]
+    customers = month["customers"]
+    customers[customer] = customers.get(customer, 0) + sign * amounts["total"]
+    if day_totals["invoices"] == 0:
+        del month["days"][day]
+    if customers[customer] == 0:
+        del customers[customer]
+
+
+class MonthlyRollups:
+    def __init__(self, folder=rollups_folder):
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+        self._months = {}
+        self._dirty = set()
+
+    def _path(self, month):
+        return os.path.join(self.folder, f"{month}.json")
+
+    def months(self):
+        return sorted(name[:-5] for name in os.listdir(self.folder) if name.endswith(".json"))
+
+    def month(self, month):
+        if month not in self._months:
+            try:
+                with open(self._path(month), "r", encoding="utf-8") as f:
+                    self._months[month] = json.load(f)
+            except (OSError, ValueError):
+                self._months[month] = _empty_month()
+        return self._months[month]
+
+    def add_bill(self, bill_data, previous=None, lsn=None, replay=False):
+        # When replaying, months already saved with this bill are skipped
+        skip = set()
+        if replay:
+            for bill in (previous, bill_data):
+                if bill is not None and self.month(_month_key(bill)).get("lsn", 0) >= lsn:
+                    skip.add(_month_key(bill))
+        if previous is not None and _month_key(previous) not in skip:
+            self._apply_bill(previous, -1, lsn)
+        if _month_key(bill_data) not in skip:
+            self._apply_bill(bill_data, 1, lsn)
+
+    def _apply_bill(self, bill_data, sign, lsn=None):
+        date = str(bill_data.get("date", ""))
+        month_key, day_key = date[:7], date[:10]
+        month = self.month(month_key)
+        _apply(month, day_key, bill_data.get("customer", ""), bill_amounts(bill_data), sign)
+        if lsn is not None:
+            month["lsn"] = lsn
+        self._dirty.add(month_key)
+
+    def save(self):
+        for month in sorted(self._dirty):
+            tmp_path = self._path(month) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._months[month], f)
+            os.replace(tmp_path, self._path(month))
+        self._dirty.clear()
+
+    def replace_month(self, month, data):
+        self._months[month] = data
+        self._dirty.add(month)
+
+    def top_customers(self, month, count=top_customer_count):
+        customers = self.month(month)["customers"]
+        return sorted(customers.items(), key=lambda kv: kv[1], reverse=True)[:count]
+
+
+def workbook_path(month, folder=reports_folder):
+    # "2025-04" -> monthly_reports/April_2025.xlsx, the name the export used before
+    return os.path.join(folder, datetime.strptime(month, "%Y-%m").strftime("%B_%Y") + ".xlsx")
+
+
+def export_month(rollups, month, ledger=None, folder=reports_folder):
+    # Writes the month's workbook in one go: summary, daily totals and top
+    # customers from the rollup, plus one line per invoice from that month's
+    # ledger segment when a ledger is given.
+    import pandas as pd
+
+    data = rollups.month(month)
+    rupees = lambda paise: paise / 100
+    summary = pd.DataFrame([{
+        "Month": month,
+        "Invoices": data["invoices"],
+        "Subtotal": rupees(data["subtotal"]),
+        "CGST": rupees(data["cgst"]),
+        "SGST": rupees(data["sgst"]),
+        "IGST": rupees(data["igst"]),
+        "Total": rupees(data["total"]),
+    }])
+    daily = pd.DataFrame([{
+        "Date": day,
+        "Invoices": totals["invoices"],
+        "Subtotal": rupees(totals["subtotal"]),
+        "CGST": rupees(totals["cgst"]),
+        "SGST": rupees(totals["sgst"]),
+        "IGST": rupees(totals["igst"]),
+        "Total": rupees(totals["total"]),
+    } for day, totals in sorted(data["days"].items())], columns=["Date", "Invoices", "Subtotal", "CGST", "SGST", "IGST", "Total"])
+    customers = pd.DataFrame([{"Customer": name, "Total": rupees(total)} for name, total in rollups.top_customers(month)],
+                             columns=["Customer", "Total"])
+
+    os.makedirs(folder, exist_ok=True)
+    path = workbook_path(month, folder)
+    with pd.ExcelWriter(path) as writer:
+        summary.to_excel(writer, sheet_name="Summary", index=False)
+        daily.to_excel(writer, sheet_name="Daily", index=False)
+        customers.to_excel(writer, sheet_name="Top Customers", index=False)
+        if ledger is not None:
+            invoice_rows(ledger, month, pd).to_excel(writer, sheet_name="Invoices", index=False)
+    return path
+
+
+def later_saves(ledger, month):
+    # {invoice: date of its latest save} over the segments after `month`
+    saves = {}
+    for row in ledger.iter_rows([m for m in ledger.months() if m > month]):
+        if row["Date"] > saves.get(row["Invoice No"], ""):
+            saves[row["Invoice No"]] = row["Date"]
+    return saves
+
+
+def invoice_rows(ledger, month, pd):
+    # One row per invoice; when it was saved more than once, the rows of the
+    # latest save win, as in rollup_from_ledger_month. Invoices saved again
+    # in a later month belong to that month and are left out.
+    invoices = {}
+    superseded = later_saves(ledger, month)
+    for row in ledger.iter_rows([month]):
+        if row["Date"] < superseded.get(row["Invoice No"], ""):
+            continue
+        invoice = invoices.get(row["Invoice No"])
+        if invoice is not None and row["Date"] < invoice["Date"]:
+            continue
+        if invoice is None or row["Date"] > invoice["Date"]:
+            invoices[row["Invoice No"]] = invoice = {
+                "Invoice No": row["Invoice No"],
+                "Date": row["Date"],
+                "Customer Name": row["Customer"],
+                "GSTIN": row["GSTIN"],
+                "Address": row["Address"],
+                "Item Details": [],
+                "Total": row["Bill Total"],
+            }
+        invoice["Item Details"].append(f'{row["Item"]}({row["Qty"]}x{row["Rate"]})')
+    for invoice in invoices.values():
+        invoice["Item Details"] = ", ".join(invoice["Item Details"])
+    return pd.DataFrame(list(invoices.values()))
+
+
+def rollup_from_ledger_month(ledger_folder, month):
+    # Runs in a worker process: fold one monthly ledger segment back into a
+    # rollup. Bill-level amounts are the sums of the bill's line amounts; when
+    # an invoice was saved more than once, the rows of the latest save win.
+    # Also returns each invoice's latest save in the month, so rebuild_all
+    # can take out the ones saved again in a later month.
+    bills = defaultdict(lambda: {"date": "", "customer": "", "amounts": dict.fromkeys(_amount_fields, 0)})
+    for row in TransactionLedger(ledger_folder).iter_rows([month]):
+        if not row.get("Taxable"):
+            # Rows written before the tax engine carry no per-line tax amounts
+            row = retax_rows([dict(row)])[0]
+        bill = bills[row["Invoice No"]]
+        if row["Date"] > bill["date"]:
+            bill["amounts"] = dict.fromkeys(_amount_fields, 0)
+        bill["date"] = row["Date"]
+        bill["customer"] = row["Customer"]
+        amounts = bill["amounts"]
+        total = to_paise(row.get("Item Total") or 0)
+        cgst = to_paise(row.get("CGST Amt") or 0)
+        sgst = to_paise(row.get("SGST Amt") or 0)
+        igst = to_paise(row.get("IGST Amt") or 0)
+        amounts["subtotal"] += to_paise(row["Taxable"])
+        amounts["cgst"] += cgst
+        amounts["sgst"] += sgst
+        amounts["igst"] += igst
+        amounts["total"] += total
+
+    data = _empty_month()
+    for bill in bills.values():
+        _apply(data, str(bill["date"])[:10], bill["customer"], bill["amounts"], 1)
+    return month, data, dict(bills)
+
+
+def rebuild_all(rollups, ledger, workers=None, lsn=None):
+    # Recompute every month from the ledger, one month per worker process.
+    # lsn is that of the last bill logged to the write-ahead log, all of
+    # which the ledger holds; replay after a crash then skips them.
+    months = ledger.months()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(rollup_from_ledger_month, [ledger.folder] * len(months), months))
+    # An invoice saved again in a later month counts only there, as when
+    # saving it subtracted the earlier save from its month
+    latest = {}
+    for month, data, bills in results:
+        for invoice_number, bill in bills.items():
+            if bill["date"] > latest.get(invoice_number, ""):
+                latest[invoice_number] = bill["date"]
+    for month, data, bills in results:
+        for invoice_number, bill in bills.items():
+            if bill["date"] < latest[invoice_number]:
+                _apply(data, str(bill["date"])[:10], bill["customer"], bill["amounts"], -1)
+        if lsn is not None:
+            data["lsn"] = lsn
+        rollups.replace_month(month, data)
+    rollups.save()
+    return months
@@ -0,0 +1,327 @@
+import gc
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+_token_re = re.compile(r"[0-9a-z]+")
+
+
+def normalize(text):
+    return str(text or "").strip().lower()
+
+
+def tokenize(text):
+    return _token_re.findall(normalize(text))
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Sortable columns: position in the summary tuple and the sort key
+sort_columns = {
+    "invoice": (0, str),
+    "date": (1, str),
+    "customer": (2, normalize),
+    "gstin": (3, normalize),
+    "total": (4, _number),
+}
+
+
+class PrefixIndex:
+    # Maps each key to the set of values carrying it, with the distinct keys
+    # kept sorted so a prefix lookup is a bisect plus a short scan.
+
+    def __init__(self):
+        self.postings = {}
+        self.keys = []
+
+    def bulk_load(self, postings):
+        self.postings = postings
+        self.keys = sorted(postings)
+
+    def add(self, key, value):
+        values = self.postings.get(key)
+        if values is None:
+            self.postings[key] = values = set()
+            insort(self.keys, key)
+        values.add(value)
+
+    def remove(self, key, value):
+        values = self.postings.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del self.postings[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def iter_keys(self, prefix):
+        keys = self.keys
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            yield keys[i]
+            i += 1
+
+    def prefix(self, prefix, scan=None):
+        # Values under every key starting with prefix; with scan, only the
+        # first `scan` keys are looked at so a one-letter prefix stays cheap
+        keys = self.iter_keys(prefix)
+        if scan is not None:
+            keys = islice(keys, scan)
+        matched = [self.postings[key] for key in keys]
+        if len(matched) == 1:
+            return set(matched[0])
+        return set().union(*matched)
+
+
+class NameIndex:
+    # Prefix indexes for a master keyed by normalized name (customers,
+    # items): each entry under its whole name and every word of it, so "tra"
+    # finds "Ram Traders", and under its code field (GSTIN, HSN) if set.
+
+    def __init__(self, code_field):
+        self.code_field = code_field
+        self.names = PrefixIndex()
+        self.codes = PrefixIndex()
+
+    def _keys(self, entry):
+        full = normalize(entry["name"])
+        names = {full, *tokenize(entry["name"])} if full else set()
+        return names, normalize(entry[self.code_field])
+
+    def add(self, key, entry):
+        names, code = self._keys(entry)
+        for name in names:
+            self.names.add(name, key)
+        if code:
+            self.codes.add(code, key)
+
+    def remove(self, key, entry):
+        names, code = self._keys(entry)
+        for name in names:
+            self.names.remove(name, key)
+        if code:
+            self.codes.remove(code, key)
+
+    def replace(self, key, previous, entry):
+        if previous is not None:
+            self.remove(key, previous)
+        self.add(key, entry)
+
+    def bulk_load(self, entries):
+        # entries: {key: entry}, e.g. straight from a snapshot
+        names, codes = {}, {}
+        for key, entry in entries.items():
+            entry_names, code = self._keys(entry)
+            for name in entry_names:
+                names.setdefault(name, set()).add(key)
+            if code:
+                codes.setdefault(code, set()).add(key)
+        self.names.bulk_load(names)
+        self.codes.bulk_load(codes)
+
+
+class BillSearchIndex:
+    # In-memory indexes over bill headers:
+    #   - exact match on invoice number (case-insensitive)
+    #   - prefix match on customer name tokens and GSTIN
+    #   - sorted (date, invoice) list for From/To range filters
+    # Each bill is kept as a small summary tuple so results can be shown
+    # without going back to the bill store.
+    #
+    # Over a partitioned bill store (for_store) months are loaded as searches
+    # reach them: a search limited to a date range reads only the partitions
+    # in that range, from their summaries.
+
+    def __init__(self):
+        self.summaries = {}
+        self.invoices = {}
+        self.names = PrefixIndex()
+        self.gstins = PrefixIndex()
+        self.dates = []
+        self.partitions = None
+        self.loaded_months = set()
+        # Searches may run on a background thread while saves add bills
+        self.lock = threading.RLock()
+
+    @classmethod
+    def for_store(cls, bill_store):
+        if not hasattr(bill_store, "month_summaries"):
+            return cls().build(bill_store)
+        index = cls()
+        index.partitions = bill_store
+        return index
+
+    def _load_months(self, date_from, date_to):
+        if self.partitions is None:
+            return
+        for month in self.partitions.months_between(date_from, date_to):
+            if month in self.loaded_months:
+                continue
+            for summary in self.partitions.month_summaries(month):
+                if summary[0] not in self.summaries:
+                    self._add_summary(summary)
+            self.loaded_months.add(month)
+
+    @staticmethod
+    def summarize(bill):
+        return (
+            bill.get("invoice_number", ""),
+            str(bill.get("date", "")),
+            bill.get("customer", ""),
+            bill.get("gst", ""),
+            bill.get("total", 0),
+        )
+
+    @staticmethod
+    def _name_keys(customer):
+        return set(tokenize(customer))
+
+    def build(self, bills):
+        # Bulk load; the cyclic GC is paused because it would otherwise rescan
+        # the millions of small objects created here over and over.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with self.lock:
+                names, gstins = {}, {}
+                for bill in bills:
+                    summary = self.summarize(bill)
+                    invoice, date, customer, gstin, _ = summary
+                    self.summaries[invoice] = summary
+                    self.invoices[normalize(invoice)] = invoice
+                    for key in self._name_keys(customer):
+                        names.setdefault(key, set()).add(invoice)
+                    if gstin:
+                        gstins.setdefault(normalize(gstin), set()).add(invoice)
+                self.names.bulk_load(names)
+                self.gstins.bulk_load(gstins)
+                self.dates = sorted((s[1], inv) for inv, s in self.summaries.items())
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return self
+
+    def _unindex(self, summary):
+        invoice, date, customer, gstin, _ = summary
+        for key in self._name_keys(customer):
+            self.names.remove(key, invoice)
+        if gstin:
+            self.gstins.remove(normalize(gstin), invoice)
+        i = bisect_left(self.dates, (date, invoice))
+        if i < len(self.dates) and self.dates[i] == (date, invoice):
+            del self.dates[i]
+
+    def add(self, bill):
+        with self.lock:
+            self._add(bill)
+
+    def _add(self, bill):
+        self._add_summary(self.summarize(bill))
+
+    def _add_summary(self, summary):
+        invoice, date, customer, gstin, _ = summary
+        if invoice in self.summaries:
+            self._unindex(self.summaries[invoice])
+        self.summaries[invoice] = summary
+        self.invoices[normalize(invoice)] = invoice
+        for key in self._name_keys(customer):
+            self.names.add(key, invoice)
+        if gstin:
+            self.gstins.add(normalize(gstin), invoice)
+        insort(self.dates, (date, invoice))
+
+    def __len__(self):
+        return len(self.summaries)
+
+    def summary(self, invoice):
+        return self.summaries.get(invoice)
+
+    def summaries_for(self, invoices):
+        with self.lock:
+            return [self.summaries.get(invoice) for invoice in invoices]
+
+    def _match_term(self, term, field):
+        term = normalize(term)
+        matches = set()
+        if field in (None, "Invoice Number"):
+            invoice = self.invoices.get(term)
+            if invoice:
+                matches.add(invoice)
+        if field in (None, "GSTIN"):
+            matches |= self.gstins.prefix(term)
+        if field in (None, "Customer Name"):
+            # Every word typed must prefix-match some word of the name
+            tokens = tokenize(term)
+            if tokens:
+                name_matches = self.names.prefix(tokens[0])
+                for token in tokens[1:]:
+                    name_matches &= self.names.prefix(token)
+                matches |= name_matches
+        return matches
+
+    def _date_range(self, date_from, date_to):
+        lo = bisect_left(self.dates, (date_from,)) if date_from else 0
+        # Dates are "YYYY-MM-DD HH:MM:SS", so "~" sorts after any time of day
+        hi = bisect_right(self.dates, (date_to + "~",)) if date_to else len(self.dates)
+        return lo, hi
+
+    def search(self, term="", field=None, date_from=None, date_to=None, limit=None,
+               sort_by="date", descending=True, cancel=None):
+        # Returns matching invoice numbers, newest first unless another sort
+        # column is asked for. `cancel` is an optional threading.Event that
+        # aborts a long search with SearchCancelled.
+        with self.lock:
+            self._load_months(date_from, date_to)
+            if sort_by == "date" and descending:
+                return self._search(term, field, date_from, date_to, limit, cancel)
+            results = self._search(term, field, date_from, date_to, None, cancel)
+            if cancel is not None and cancel.is_set():
+                raise SearchCancelled()
+            if sort_by == "date":
+                results.reverse()
+            else:
+                column, key = sort_columns[sort_by]
+                summaries = self.summaries
+                results.sort(key=lambda invoice: key(summaries[invoice][column]), reverse=descending)
+            return results[:limit]
+
+    def _search(self, term, field, date_from, date_to, limit, cancel):
+        lo, hi = self._date_range(date_from, date_to)
+        dates = self.dates
+        if not normalize(term):
+            if limit is not None:
+                lo = max(lo, hi - limit)
+            return [dates[i][1] for i in range(hi - 1, lo - 1, -1)]
+        matches = self._match_term(term, field)
+        if len(matches) * 8 >= hi - lo:
+            # Broad term: walking the date-ordered range beats sorting matches
+            results = []
+            for i in range(hi - 1, lo - 1, -1):
+                if cancel is not None and i % 4096 == 0 and cancel.is_set():
+                    raise SearchCancelled()
+                invoice = dates[i][1]
+                if invoice in matches:
+                    results.append(invoice)
+                    if len(results) == limit:
+                        break
+            return results
+        results = []
+        for invoice in matches:
+            date = self.summaries[invoice][1]
+            if date_from and date < date_from:
+                continue
+            if date_to and date > date_to + "~":
+                continue
+            results.append((date, invoice))
+        results.sort(reverse=True)
+        return [invoice for _, invoice in results[:limit]]
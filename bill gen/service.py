@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from billing_core import build_bill, make_item, parse_invoice_number, render_html_bill
+from customers import CustomerMaster
+from invoice_allocator import InvoiceAllocator, live_leases
+from items import ItemCatalog
+from persistence import PersistenceWorker, open_views
+from search_index import BillSearchIndex
+from wal import WalInUse
+
+# Local billing service so several desks can share one set of data files:
+#
+#   python bill_prototype.py serve [--host 127.0.0.1] [--port 8765]
+#   BILL_SERVICE_URL=http://127.0.0.1:8765 python bill_prototype.py
+#
+# One process owns the bill store, ledger, rollups and invoice counter. Saves
+# from every desk go through a single PersistenceWorker, so writes are
+# serialized and grouped into one fsync per batch; invoice numbers are leased
+# to desks in blocks under the counter lock as before. Reads never wait for
+# writes: bill lookups run on their own thread, searches on the in-memory
+# index.
+#
+#   GET  /health                          {"status", "bills", "pending"}
+#   POST /invoice-numbers                 {"terminal", "count"} -> {"start", "end"}
+#   POST /invoice-numbers/release         {"terminal", "numbers", "reason"}
+#   POST /bills                           bill fields -> saved bill (201)
+#   GET  /bills/<invoice>                 bill
+#   GET  /bills/<invoice>/html            rendered invoice
+#   GET  /bills?term=&field=&from=&to=&sort=&desc=&limit=
+#                                         {"invoices": [...]}
+#   POST /bills/summaries                 {"invoices"} -> {"summaries"}
+#   POST /render                          bill fields -> HTML, nothing saved
+#   GET  /customers?q=  /customers/gstin?q=  /items?q=  /items/hsn?q=
+
+default_host = "127.0.0.1"
+default_port = 8765
+max_body_size = 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+_reasons = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def bill_from_request(data):
+    # Totals are always recomputed here; only the entered fields are trusted.
+    # The desk's date is kept so the saved bill matches the one it printed.
+    if not isinstance(data, dict):
+        raise HTTPError(400, "expected a JSON object")
+    date = data.get("date") or None
+    if date is not None:
+        try:
+            datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            raise HTTPError(400, "date must be YYYY-MM-DD HH:MM:SS") from None
+    try:
+        items = [make_item(item.get("name", ""), item.get("hsn", ""), item.get("qty"), item.get("rate"), item.get("gst"))
+                 for item in data.get("items") or []]
+        if not items:
+            raise HTTPError(400, "a bill needs at least one item")
+        return build_bill(str(data.get("invoice_number", "")), data.get("customer", ""), data.get("gst", ""),
+                          data.get("address", ""), items, data.get("cgst", ""), data.get("sgst", ""),
+                          date=date, igst=bool(data.get("igst")))
+    except (AttributeError, TypeError, ValueError):
+        raise HTTPError(400, "invalid quantity, rate, GST or tax rate") from None
+
+
+class BillingService:
+    def __init__(self):
+        # Caught up from the write-ahead log tail if the last run crashed
+        self.wal, self.bill_store, self.ledger, self.rollups, replayed = open_views()
+        InvoiceAllocator(terminal_id="service").advance_past_bills(replayed)
+        # Numbers a desk may save a bill under: leased and not released
+        self.leased = live_leases()
+        self.search_index = BillSearchIndex.for_store(self.bill_store)
+        self.customers = CustomerMaster().load(self.bill_store)
+        self.item_catalog = ItemCatalog().load(self.ledger)
+        # Guards the customer/item indexes, updated on the writer thread
+        self.lookup_lock = threading.Lock()
+        self.writer = PersistenceWorker(self.bill_store, self.ledger, self.rollups, on_result=self.on_written,
+                                        wal=self.wal)
+        self.readers = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bill-reader")
+        self.waiting = {}
+        self.loop = None
+
+    # -- writes --------------------------------------------------------
+
+    def on_written(self, bill_data, error):
+        # Writer thread: refresh the indexes, then wake the waiting request
+        if error is None:
+            self.search_index.add(bill_data)
+            with self.lookup_lock:
+                self.customers.add_bill(bill_data)
+                self.item_catalog.add_bill(bill_data)
+        future = self.waiting.pop(id(bill_data), None)
+        if future is not None:
+            self.loop.call_soon_threadsafe(_resolve, future, bill_data, error)
+
+    async def create_bill(self, data):
+        bill_data = bill_from_request(data)
+        invoice_number = bill_data["invoice_number"]
+        if not invoice_number:
+            raise HTTPError(400, "invoice_number is required; lease one from /invoice-numbers")
+        try:
+            number = parse_invoice_number(invoice_number)
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+        if number not in self.leased and invoice_number not in self.bill_store:
+            raise HTTPError(400, f"{invoice_number} was not leased to a desk; lease one from /invoice-numbers")
+        future = self.loop.create_future()
+        self.waiting[id(bill_data)] = future
+        self.writer.submit(bill_data)
+        return await future
+
+    async def lease(self, data):
+        terminal = str(data.get("terminal") or "desk")
+        count = max(1, min(int(data.get("count") or 10), 1000))
+        allocator = InvoiceAllocator(terminal_id=terminal, is_used=self.bill_store.__contains__)
+        start, end = await self.loop.run_in_executor(None, allocator.lease, count)
+        self.leased.update(range(start, end + 1))
+        return {"start": start, "end": end}
+
+    async def release(self, data):
+        allocator = InvoiceAllocator(terminal_id=str(data.get("terminal") or "desk"))
+        for number in reversed([int(n) for n in data.get("numbers") or []]):
+            allocator.return_number(number)
+        released = await self.loop.run_in_executor(None, allocator.release, str(data.get("reason") or "released"))
+        self.leased.difference_update(released)
+        return {"released": released}
+
+    # -- reads ---------------------------------------------------------
+
+    async def get_bill(self, invoice_number):
+        bill_data = await self.loop.run_in_executor(self.readers, self.bill_store.get, invoice_number)
+        if bill_data is None:
+            raise HTTPError(404, f"no bill {invoice_number}")
+        return bill_data
+
+    async def search(self, query):
+        first = lambda name, default=None: query.get(name, [default])[0]
+        limit = first("limit")
+        kwargs = dict(
+            term=first("term", ""),
+            field=first("field"),
+            date_from=first("from"),
+            date_to=first("to"),
+            limit=int(limit) if limit else None,
+            sort_by=first("sort", "date"),
+            descending=first("desc", "1") not in ("0", "false"),
+        )
+        if kwargs["sort_by"] not in ("invoice", "date", "customer", "gstin", "total"):
+            raise HTTPError(400, f"cannot sort by {kwargs['sort_by']}")
+        def run():
+            with metrics.span("search"):
+                return self.search_index.search(**kwargs)
+
+        return {"invoices": await self.loop.run_in_executor(None, run)}
+
+    def lookup(self, kind, text):
+        with self.lookup_lock:
+            if kind == "customers":
+                return self.customers.match(text)
+            if kind == "customers/gstin":
+                return self.customers.match_gstin(text)
+            if kind == "items":
+                return self.item_catalog.match(text)
+            return self.item_catalog.match_hsn(text)
+
+    # -- HTTP ----------------------------------------------------------
+
+    async def dispatch(self, method, path, query, body):
+        # Returns (status, content type, payload); payload is str for HTML
+        parts = [unquote(part) for part in path.strip("/").split("/") if part]
+        data = {}
+        if method == "POST":
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPError(400, "body is not valid JSON") from None
+            if not isinstance(data, dict):
+                raise HTTPError(400, "expected a JSON object")
+
+        if parts == ["health"] and method == "GET":
+            return 200, "application/json", {"status": "ok", "bills": len(self.bill_store), "pending": self.writer.pending}
+        if parts == ["invoice-numbers"] and method == "POST":
+            return 200, "application/json", await self.lease(data)
+        if parts == ["invoice-numbers", "release"] and method == "POST":
+            return 200, "application/json", await self.release(data)
+        if parts == ["bills"] and method == "POST":
+            return 201, "application/json", await self.create_bill(data)
+        if parts == ["bills"] and method == "GET":
+            return 200, "application/json", await self.search(query)
+        if parts == ["bills", "summaries"] and method == "POST":
+            return 200, "application/json", {"summaries": self.search_index.summaries_for(data.get("invoices") or [])}
+        if len(parts) == 2 and parts[0] == "bills" and method == "GET":
+            return 200, "application/json", await self.get_bill(parts[1])
+        if len(parts) == 3 and parts[0] == "bills" and parts[2] == "html" and method == "GET":
+            bill_data = await self.get_bill(parts[1])
+            with metrics.span("render_html"):
+                return 200, "text/html; charset=utf-8", render_html_bill(bill_data)
+        if parts == ["render"] and method == "POST":
+            return 200, "text/html; charset=utf-8", render_html_bill(bill_from_request(data))
+        if "/".join(parts) in ("customers", "customers/gstin", "items", "items/hsn") and method == "GET":
+            return 200, "application/json", {"results": self.lookup("/".join(parts), query.get("q", [""])[0])}
+        if parts and parts[0] in ("health", "invoice-numbers", "bills", "render", "customers", "items"):
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"no such endpoint {path}")
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive; one request at a time per connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                if length < 0:
+                    # The body can't be skipped without its length
+                    status, content_type, payload = 400, "application/json", {"error": "invalid Content-Length"}
+                    keep_alive = False
+                elif length > max_body_size:
+                    status, content_type, payload = 413, "application/json", {"error": "request body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    url = urlsplit(target)
+                    try:
+                        status, content_type, payload = await self.dispatch(method, url.path, parse_qs(url.query), body)
+                    except HTTPError as e:
+                        status, content_type, payload = e.status, "application/json", {"error": str(e)}
+                    except Exception as e:
+                        status, content_type, payload = 500, "application/json", {"error": str(e)}
+
+                if isinstance(payload, str):
+                    content = payload.encode("utf-8")
+                else:
+                    content = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                head = (f"HTTP/1.1 {status} {_reasons.get(status, '')}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Length: {len(content)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+                writer.write(head.encode("latin-1") + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=default_host, port=default_port):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Billing service on http://{host}:{port} ({len(self.bill_store)} bills)", flush=True)
+        # Stop cleanly on Ctrl+C / SIGTERM so queued bills are written
+        stop = asyncio.Event()
+        for signame in ("SIGINT", "SIGTERM"):
+            try:
+                self.loop.add_signal_handler(getattr(signal, signame), stop.set)
+            except (NotImplementedError, AttributeError):
+                pass  # Windows: Ctrl+C surfaces as KeyboardInterrupt in main()
+        async with server:
+            await stop.wait()
+
+    def close(self):
+        self.writer.close()
+        self.readers.shutdown()
+        with self.lookup_lock:
+            self.customers.save(len(self.bill_store))
+            self.item_catalog.save(self.ledger)
+        self.bill_store.close()
+        self.ledger.close()
+        self.wal.close()
+
+
+def _resolve(future, bill_data, error):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(bill_data)
+    else:
+        future.set_exception(HTTPError(500, f"bill {bill_data['invoice_number']} could not be saved: {error}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bill_prototype.py serve", description="Serve bills to billing desks over HTTP.")
+    parser.add_argument("--host", default=os.environ.get("BILL_SERVICE_HOST", default_host))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BILL_SERVICE_PORT", default_port)))
+    args = parser.parse_args(argv)
+
+    try:
+        service = BillingService()
+    except WalInUse as e:
+        print(e)
+        return 1
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
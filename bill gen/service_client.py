@@ -0,0 +1,196 @@
+import json
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+
+import metrics
+from invoice_allocator import InvoiceAllocator, default_terminal_id
+from persistence import PersistenceWorker
+from search_index import SearchCancelled
+
+# Client side of service.py. BillingClient wraps the HTTP endpoints; the
+# Remote* classes stand in for the bill store, allocator, persistence worker,
+# search index, customer master and item catalog, so the Tk app runs
+# unchanged against a billing service (BILL_SERVICE_URL) instead of local
+# files.
+
+
+class ServiceError(Exception):
+    pass
+
+
+class BillingClient:
+    def __init__(self, base_url, timeout=10, lookup_timeout=2):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.lookup_timeout = lookup_timeout
+
+    def request(self, method, path, data=None, raw=False, timeout=None):
+        body = None if data is None else json.dumps(data).encode("utf-8")
+        request = Request(self.base_url + path, data=body, method=method,
+                          headers={"Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=timeout or self.timeout) as response:
+                content = response.read()
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServiceError(f"{e.code}: {message}") from None
+        except URLError as e:
+            raise ServiceError(f"billing service unreachable at {self.base_url}: {e.reason}") from None
+        return content.decode("utf-8") if raw else json.loads(content)
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def lease(self, terminal, count):
+        return self.request("POST", "/invoice-numbers", {"terminal": terminal, "count": count})
+
+    def release(self, terminal, numbers, reason):
+        return self.request("POST", "/invoice-numbers/release", {"terminal": terminal, "numbers": numbers, "reason": reason})
+
+    def create_bill(self, bill_data):
+        return self.request("POST", "/bills", bill_data)
+
+    def get_bill(self, invoice_number):
+        return self.request("GET", f"/bills/{quote(invoice_number, safe='')}")
+
+    def render_bill(self, invoice_number):
+        return self.request("GET", f"/bills/{quote(invoice_number, safe='')}/html", raw=True)
+
+    def render(self, bill_data):
+        return self.request("POST", "/render", bill_data, raw=True)
+
+    def search(self, term="", field=None, date_from=None, date_to=None, limit=None, sort_by="date", descending=True):
+        params = {"term": term, "sort": sort_by, "desc": "1" if descending else "0"}
+        for name, value in (("field", field), ("from", date_from), ("to", date_to), ("limit", limit)):
+            if value:
+                params[name] = value
+        return self.request("GET", "/bills?" + urlencode(params))["invoices"]
+
+    def summaries(self, invoices):
+        return self.request("POST", "/bills/summaries", {"invoices": list(invoices)})["summaries"]
+
+    def lookup(self, kind, text):
+        # Autocomplete only: a service hiccup just means no suggestions
+        try:
+            return self.request("GET", f"/{kind}?" + urlencode({"q": text}), timeout=self.lookup_timeout)["results"]
+        except (ServiceError, OSError):
+            return []
+
+
+class RemoteBillStore:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, invoice_number):
+        return self.client.get_bill(invoice_number)
+
+    def __contains__(self, invoice_number):
+        return self.get(invoice_number) is not None
+
+    def __len__(self):
+        return self.client.health()["bills"]
+
+
+class RemoteAllocator(InvoiceAllocator):
+    # Same block leasing, but the service holds the counter and audit log
+    def __init__(self, client, terminal_id=None, block_size=10):
+        super().__init__(terminal_id or default_terminal_id(), block_size)
+        self.client = client
+
+    def lease(self, count=None):
+        count = count or self.block_size
+        lease = self.client.lease(self.terminal_id, count)
+        self._available.extend(range(lease["start"], lease["end"] + 1))
+        return lease["start"], lease["end"]
+
+    def release(self, reason="released"):
+        if not self._available:
+            return []
+        unused = list(self._available)
+        self._available.clear()
+        try:
+            self.client.release(self.terminal_id, unused, reason)
+        except ServiceError:
+            pass  # still listed as leased but unsaved in the service's audit
+        return unused
+
+
+class RemotePersistence(PersistenceWorker):
+    # Bills are posted to the service from the worker thread; the service
+    # does the grouping and fsyncs on its side
+    def __init__(self, client, retries=3):
+        self.client = client
+        super().__init__(None, None, max_batch=1, retries=retries)
+
+    def _write(self, bill_data, lsn=None):
+        with metrics.span("service.create_bill"):
+            self.client.create_bill(bill_data)
+
+    def _sync(self):
+        pass
+
+
+class RemoteSearchIndex:
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, cancel=None, **query):
+        results = self.client.search(**query)
+        if cancel is not None and cancel.is_set():
+            raise SearchCancelled()
+        return results
+
+    def summaries_for(self, invoices):
+        return self.client.summaries(invoices)
+
+    def add(self, bill_data):
+        pass  # the service indexes bills as it saves them
+
+
+class RemoteCustomers:
+    def __init__(self, client):
+        self.client = client
+
+    def match(self, text):
+        return self.client.lookup("customers", text)
+
+    def match_gstin(self, text):
+        return self.client.lookup("customers/gstin", text)
+
+    def add_bill(self, bill_data):
+        pass
+
+    def save(self, *args):
+        pass
+
+
+class RemoteItems:
+    def __init__(self, client):
+        self.client = client
+
+    def match(self, text):
+        return self.client.lookup("items", text)
+
+    def match_hsn(self, text):
+        return self.client.lookup("items/hsn", text)
+
+    def get(self, name):
+        for item in self.match(name):
+            if item["name"].strip().lower() == name.strip().lower():
+                return item
+        return None
+
+    def use(self, name):
+        pass
+
+    def add_bill(self, bill_data):
+        pass
+
+    def save(self, *args):
+        pass
@@ -0,0 +1,86 @@
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Startup helpers. The billing form is drawn before anything heavy happens:
+# data files are opened off the Tk thread once the window is up, and pandas /
+# openpyxl (only needed for Excel exports) are imported lazily by the features
+# that use them, or warmed up in the background after the data files load.
+
+preload_modules = ("pandas", "openpyxl")
+startup_profile_file = "startup_profile.json"
+
+
+class StartupTimer:
+    # Milliseconds since this module was imported, per named startup step
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks[name] = round((time.perf_counter() - self.started) * 1000, 1)
+        return self.marks[name]
+
+
+startup_timer = StartupTimer()
+
+
+def preload_in_background(modules=preload_modules):
+    # Import the heavy optional modules on a daemon thread so the first export
+    # does not stall the window. Missing modules are simply skipped.
+    def worker():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    thread = threading.Thread(target=worker, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(module="bill_prototype", top=15):
+    # Run `python -X importtime -c "import <module>"` in a fresh interpreter
+    # and return the total plus the slowest imports by cumulative time (ms)
+    import subprocess
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+            imports.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+        except ValueError:
+            continue  # the header line
+    top_level = [entry for entry in imports if entry["module"] == module]
+    total = top_level[-1]["cumulative_ms"] if top_level else None
+    slowest = sorted(imports, key=lambda entry: entry["cumulative_ms"], reverse=True)[:top]
+    return {"module": module, "total_ms": total, "slowest": slowest, "returncode": proc.returncode}
+
+
+def write_startup_report(imports, marks, path=startup_profile_file):
+    report = {"time": time.strftime('%Y-%m-%d %H:%M:%S'), "imports": imports, "startup_ms": marks}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if imports["returncode"] != 0:
+        print(f"Import of {imports['module']} failed (exit code {imports['returncode']})")
+    else:
+        print(f"Import of {imports['module']}: {imports['total_ms']} ms")
+    for entry in imports["slowest"]:
+        print(f"  {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+    if marks:
+        print("Startup steps (ms since launch):")
+        for name, ms in marks.items():
+            print(f"  {ms:>9.1f} ms  {name}")
+    else:
+        print("No display available; only imports were profiled.")
+    print(f"Report written to {path}")
+    return report
@@ -0,0 +1,156 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+# GST arithmetic in integer paise. Money is held as int paise and rates as
+# int basis points (18% -> 1800), so every total is exact to the paisa and
+# the only rounding is an explicit half-up at the end of each line.
+#
+# Bills and ledgers are taxed a column at a time: pull qty/rate/rate-of-tax
+# out into lists once, then run one integer pass over them.
+
+
+# Ledgers repeat the same few rates and prices over and over, so parsing the
+# text through Decimal is cached per distinct string.
+@lru_cache(maxsize=65536)
+def _hundredths(text):
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Invalid number: {text!r}") from None
+    if not value.is_finite():
+        raise ValueError(f"Invalid number: {text!r}")
+    return int((value * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def to_paise(amount):
+    return _hundredths(str(amount).strip() or "0")
+
+
+@lru_cache(maxsize=65536)
+def _exact_hundredths(text):
+    # A unit rate in paise without rounding: an int, or a Decimal when the
+    # rate has fractions of a paisa (10.005)
+    _hundredths(text)  # validates
+    value = Decimal(text) * 100
+    return int(value) if value == value.to_integral_value() else value
+
+
+def line_taxable(qty, rate):
+    # qty x rate in paise, rounded once for the whole line rather than
+    # rounding the unit rate first (1000 x 10.005 is 10005.00, not 10010.00)
+    hundredths = _exact_hundredths(str(rate).strip() or "0")
+    if type(hundredths) is int:
+        return qty * hundredths
+    return int((qty * hundredths).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def to_basis_points(rate):
+    if rate is None or str(rate).strip() == "":
+        return None
+    return _hundredths(str(rate).strip().rstrip("%"))
+
+
+def from_paise(paise):
+    return paise / 100
+
+
+def _div_half_up(numerator, denominator):
+    # Integer division rounding half away from zero
+    q, r = divmod(abs(numerator), denominator)
+    if 2 * r >= denominator:
+        q += 1
+    return q if numerator >= 0 else -q
+
+
+def line_tax(taxable, gst_bp, cgst_bp=None, sgst_bp=None, igst=False):
+    # (CGST, SGST, IGST) in paise for one line. Inter-state lines are all
+    # IGST. Otherwise the item's GST rate is split in the ratio of the bill's
+    # CGST and SGST rates (half each when they are blank) and each part is
+    # rounded on its own, as it is printed on the invoice.
+    if igst:
+        return 0, 0, _div_half_up(taxable * gst_bp, 10000)
+    cgst_share, sgst_share = (cgst_bp or 0), (sgst_bp or 0)
+    if cgst_share + sgst_share == 0:
+        cgst_share = sgst_share = 1
+    denominator = 10000 * (cgst_share + sgst_share)
+    return (_div_half_up(taxable * gst_bp * cgst_share, denominator),
+            _div_half_up(taxable * gst_bp * sgst_share, denominator),
+            0)
+
+
+def line_amounts(qtys, rates, gst_bps, cgst_bp=None, sgst_bp=None, igst=False):
+    # Taxable value, CGST, SGST, IGST and line total (all paise) for parallel
+    # columns of one bill; rates are in rupees
+    taxable = [line_taxable(q, r) for q, r in zip(qtys, rates)]
+    taxes = [line_tax(t, g, cgst_bp, sgst_bp, igst) for t, g in zip(taxable, gst_bps)]
+    cgst = [t[0] for t in taxes]
+    sgst = [t[1] for t in taxes]
+    igst_amt = [t[2] for t in taxes]
+    totals = [t + sum(x) for t, x in zip(taxable, taxes)]
+    return taxable, cgst, sgst, igst_amt, totals
+
+
+def compute_bill_taxes(items, cgst="", sgst="", igst=False):
+    # Fills taxable/tax/total per item and returns the bill-level sums in
+    # rupees. `items` are dicts with qty, rate and gst, as built by make_item.
+    qtys = [int(item["qty"]) for item in items]
+    rates = [item["rate"] for item in items]
+    gst_bps = [to_basis_points(item["gst"]) or 0 for item in items]
+    taxable, cgst_amt, sgst_amt, igst_amt, totals = line_amounts(
+        qtys, rates, gst_bps, to_basis_points(cgst), to_basis_points(sgst), igst)
+
+    for i, item in enumerate(items):
+        item["taxable"] = from_paise(taxable[i])
+        item["cgst_amount"] = from_paise(cgst_amt[i])
+        item["sgst_amount"] = from_paise(sgst_amt[i])
+        item["igst_amount"] = from_paise(igst_amt[i])
+        item["total"] = from_paise(totals[i])
+
+    return {
+        "subtotal": from_paise(sum(taxable)),
+        "cgst_amount": from_paise(sum(cgst_amt)),
+        "sgst_amount": from_paise(sum(sgst_amt)),
+        "igst_amount": from_paise(sum(igst_amt)),
+        "total": from_paise(sum(totals)),
+    }
+
+
+def retax_rows(rows, rate_overrides=None):
+    # Recompute ledger rows in one pass, optionally with new GST rates per
+    # HSN code ({"8431": 18, ...}). Rows are transaction ledger dicts; the
+    # per-line amounts are rewritten and the bill totals re-summed. A bill
+    # total covers its own save only: the rows of one save are consecutive
+    # and share the invoice number and date, and a re-saved invoice gets a
+    # new run of rows.
+    rows = list(rows)
+    rate_overrides = {str(k): v for k, v in (rate_overrides or {}).items()}
+    for row in rows:
+        if str(row.get("HSN", "")) in rate_overrides:
+            row["Item GST"] = rate_overrides[str(row["HSN"])]
+
+    qtys = [int(float(row["Qty"])) for row in rows]
+    taxable = [line_taxable(q, row["Rate"]) for q, row in zip(qtys, rows)]
+
+    bill_totals, saves, previous = [], [], None
+    for i, row in enumerate(rows):
+        if (row["Invoice No"], row["Date"]) != previous:
+            previous = (row["Invoice No"], row["Date"])
+            bill_totals.append(0)
+        saves.append(len(bill_totals) - 1)
+        if row.get("IGST") in ("Yes", "No"):
+            igst = row["IGST"] == "Yes"
+        else:
+            # Rows written before the ledger recorded the bill's IGST flag
+            igst = to_paise(row.get("IGST Amt") or 0) != 0
+        cgst, sgst, igst_amt = line_tax(taxable[i], to_basis_points(row["Item GST"]) or 0,
+                                        to_basis_points(row.get("CGST")), to_basis_points(row.get("SGST")), igst)
+        total = taxable[i] + cgst + sgst + igst_amt
+        row["Taxable"] = from_paise(taxable[i])
+        row["CGST Amt"] = from_paise(cgst)
+        row["SGST Amt"] = from_paise(sgst)
+        row["IGST Amt"] = from_paise(igst_amt)
+        row["Item Total"] = from_paise(total)
+        bill_totals[-1] += total
+    for row, save in zip(rows, saves):
+        row["Bill Total"] = from_paise(bill_totals[save])
+    return rows
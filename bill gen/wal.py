@@ -0,0 +1,215 @@
+import json
+import os
+import zlib
+from contextlib import ExitStack
+
+from invoice_allocator import file_lock
+
+wal_file = "bills.wal"
+wal_checkpoint_file = "bills.wal.checkpoint"
+wal_lock_file = "bills.wal.lock"
+wal_max_size = 16 * 1024 * 1024  # start the log afresh past this, at a checkpoint
+
+# Write-ahead log for saved bills. Every bill is written here once, as one
+# line "<crc32> <lsn> <json>", and fsynced before the bill store, ledger and
+# rollups are touched; a bill is committed once its line is on disk. The
+# views are synced afterwards and, every so often, a checkpoint records the
+# last log sequence number (lsn) they hold and the size of each view file at
+# that point.
+#
+# On startup the view files are cut back to the checkpoint sizes, which
+# drops anything half-written after it, and only the records past the
+# checkpoint are replayed. A torn or corrupt record ends the log: it was
+# never acknowledged, so it is cut off too.
+#
+# One process owns the log, and with it the bill store, ledger and rollups
+# of the folder: it holds bills.wal.lock from opening the log until close().
+# A second app window, batch run or service on the same folder is refused
+# (WalInUse) rather than logging bills out of sequence and cutting the other
+# process's files back at startup.
+
+
+class WalInUse(Exception):
+    pass
+
+
+def _crc(lsn, payload):
+    return zlib.crc32(f"{lsn} ".encode("utf-8") + payload)
+
+
+def encode_record(lsn, record):
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return f"{_crc(lsn, payload):08x} {lsn} ".encode("utf-8") + payload + b"\n"
+
+
+def decode_record(line):
+    # (lsn, record), or None for a torn or corrupt line
+    if not line.endswith(b"\n"):
+        return None
+    parts = line[:-1].split(b" ", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    crc, lsn, payload = parts
+    try:
+        if int(crc, 16) != _crc(int(lsn), payload):
+            return None
+        return int(lsn), json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path):
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, path=wal_file, checkpoint_path=wal_checkpoint_file, max_size=wal_max_size,
+                 lock_path=wal_lock_file):
+        self._owner = ExitStack()
+        try:
+            self._owner.enter_context(file_lock(lock_path, wait=False))
+        except OSError:
+            raise WalInUse("Another billing window, batch run or billing service is using the data files in "
+                           f"this folder ({os.path.abspath(lock_path)}). Close it first, or have every desk "
+                           "work through the billing service (BILL_SERVICE_URL).") from None
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.max_size = max_size
+        self.has_checkpoint = os.path.exists(checkpoint_path)
+        self.checkpoint_state = self._read_checkpoint()
+        self.checkpoint_lsn = self.checkpoint_state["lsn"]
+        self.lsn = self.checkpoint_lsn
+        self._tail = self._scan()
+        self._file = open(self.path, "ab")
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("lsn", 0)
+        state.setdefault("offset", 0)
+        state.setdefault("files", {})
+        state.setdefault("folders", {})
+        return state
+
+    def _scan(self):
+        # Records past the checkpoint; cuts the log after the last good one
+        tail = []
+        if not os.path.exists(self.path):
+            return tail
+        offset = min(self.checkpoint_state["offset"], os.path.getsize(self.path))
+        good_end = offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                decoded = decode_record(line)
+                if decoded is None:
+                    break  # torn write
+                lsn, record = decoded
+                if lsn > self.checkpoint_lsn:
+                    if lsn != self.lsn + 1:
+                        break  # not the record that should come next
+                    tail.append((lsn, record))
+                    self.lsn = lsn
+                good_end += len(line)
+        if os.path.getsize(self.path) > good_end:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        return tail
+
+    def tail(self):
+        # (lsn, record) pairs written since the last checkpoint, oldest first
+        return list(self._tail)
+
+    def restore_files(self):
+        # Cut the view files back to the sizes they had at the checkpoint, and
+        # drop files created in the checked folders after it. Call before the
+        # views are opened, then replay tail() into them.
+        if not self.has_checkpoint:
+            return
+        files = self.checkpoint_state["files"]
+        for path, size in files.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        for folder, suffixes in self.checkpoint_state["folders"].items():
+            if not os.path.isdir(folder):
+                continue
+            suffixes = tuple(suffixes) if isinstance(suffixes, list) else suffixes
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if name.endswith(suffixes) and path not in files:
+                    os.remove(path)
+
+    def append(self, record):
+        # Buffered; the record is committed by the next sync()
+        self.lsn += 1
+        self._file.write(encode_record(self.lsn, record))
+        return self.lsn
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self):
+        # (lsn, offset) to roll back to if the next records fail to commit
+        return self.lsn, self._file.tell()
+
+    def rollback(self, lsn, offset):
+        # Drop what was appended since position() returned (lsn, offset), e.g.
+        # a group whose write or fsync failed part way. Retrying on top of it
+        # would leave a torn record or an lsn gap mid-log, where the next
+        # startup stops reading and cuts off every later bill.
+        try:
+            self._file.close()
+        except OSError:
+            pass  # the unwritten buffer goes; it is cut off below anyway
+        with open(self.path, "r+b") as f:
+            f.truncate(offset)
+        self._file = open(self.path, "ab")
+        self.lsn = lsn
+
+    def checkpoint(self, files, folders=None):
+        # Everything appended so far is in the views, and the views are
+        # synced: record their file sizes. Past max_size the log is emptied;
+        # the checkpoint goes first, so a crash in between only leaves
+        # records the checkpoint already covers.
+        self._file.flush()
+        offset = self._file.tell()
+        restart = offset >= self.max_size
+        state = {
+            "lsn": self.lsn,
+            "offset": 0 if restart else offset,
+            "files": {path: os.path.getsize(path) for path in files if os.path.exists(path)},
+            "folders": folders or {},
+        }
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        _fsync_dir(self.checkpoint_path)
+        if restart:
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+        self.has_checkpoint = True
+        self.checkpoint_state = state
+        self.checkpoint_lsn = self.lsn
+        self._tail = []
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def close(self):
+        self._file.close()
+        self._owner.close()